@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""asyncio client for a Hayward/Goldline AquaLogic/ProLogic
+pool controller."""
+
+import asyncio
+import logging
+import serial
+
+from .core import AquaLogic
+from .scheduler import PRIORITY_NORMAL
+from .reader import BufferedReader
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AsyncAquaLogic(AquaLogic):
+    """AquaLogic client driven by an asyncio event loop.
+
+    Decoding and state handling are shared with AquaLogic; reads,
+    writes and state change confirmation run on the event loop instead
+    of threads."""
+
+    def __init__(self):
+        super().__init__()
+        self._loop = None
+        self._stream_reader = None
+        self._stream_writer = None
+        self._listeners = []
+        self._last_pushed = None
+        self._last_queued = None
+        self._data_changed_callback = None
+
+    def _connected(self, tx_wait_for_keepalive, tx_retry_enabled):
+        self._loop = asyncio.get_running_loop()
+        self._decoder.reset()
+        self._tx_wait_for_keepalive = tx_wait_for_keepalive
+        self._tx_retry_enabled = tx_retry_enabled
+
+    async def connect(self, host, port, tx_wait_for_keepalive=True,
+                      tx_retry_enabled=True):
+        await self.connect_socket(host, port, tx_wait_for_keepalive,
+                                  tx_retry_enabled)
+
+    async def connect_socket(self, host, port, tx_wait_for_keepalive=True,
+                             tx_retry_enabled=True):
+        """Connects via a RS-485 to Ethernet adapter."""
+        self._stream_reader, self._stream_writer = \
+            await asyncio.open_connection(host, port)
+        self._write = self._stream_writer.write
+        self._connected(tx_wait_for_keepalive, tx_retry_enabled)
+        _LOGGER.info("Connected to %s:%d", host, port)
+
+    async def connect_serial(self, serial_port_name,
+                             tx_wait_for_keepalive=True,
+                             tx_retry_enabled=True):
+        """Connects via a serial port, polled by the event loop."""
+        self._serial = serial.Serial(port=serial_port_name, baudrate=19200,
+                                     stopbits=serial.STOPBITS_TWO, timeout=0)
+        self._stream_reader = asyncio.StreamReader()
+        self._write = self._serial.write
+        self._connected(tx_wait_for_keepalive, tx_retry_enabled)
+        self._loop.add_reader(self._serial.fileno(), self._serial_readable)
+
+    def _serial_readable(self):
+        try:
+            data = self._serial.read(max(self._serial.in_waiting, 1))
+        except serial.SerialException as error:
+            self._stream_reader.set_exception(error)
+            return
+        if data:
+            self._stream_reader.feed_data(data)
+
+    async def close(self):
+        """Closes the connection."""
+        if self._serial is not None:
+            self._loop.remove_reader(self._serial.fileno())
+            self._serial.close()
+            self._serial = None
+        if self._stream_writer is not None:
+            self._stream_writer.close()
+            await self._stream_writer.wait_closed()
+            self._stream_writer = None
+
+    async def process(self, data_changed_callback=None):
+        """Process data; returns when the connection closes or times out.
+        Callback is notified when any data changes."""
+        self._data_changed_callback = data_changed_callback
+        frame_rx_time = self._loop.time()
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(
+                        self._stream_reader.read(BufferedReader.BUFFER_SIZE),
+                        self.READ_TIMEOUT)
+                except asyncio.TimeoutError:
+                    _LOGGER.info("read timeout")
+                    return
+                if not data:
+                    _LOGGER.info("eof")
+                    return
+                if self._process_data(data, self._data_changed):
+                    frame_rx_time = self._loop.time()
+                elif self._loop.time() - frame_rx_time > self.READ_TIMEOUT:
+                    _LOGGER.info('Frame timeout')
+                    return
+        finally:
+            if self._changes:
+                # Deliver what is still waiting out the debounce period
+                self._flush_changes(force=True)
+            self.save_state_cache()
+            for listener in self._listeners:
+                listener.put_nowait(None)
+
+    def _data_changed(self, panel):
+        if self._data_changed_callback is not None:
+            self._data_changed_callback(panel)
+        snapshot = self._snapshot
+        if self._listeners and snapshot is not self._last_pushed:
+            # Called for each field a frame changed, but it was all
+            # published as one snapshot
+            self._last_pushed = snapshot
+            for listener in self._listeners:
+                listener.put_nowait(snapshot)
+
+    async def events(self):
+        """Asynchronously iterates over data changes, yielding the
+        PanelSnapshot published by each change; ends when process()
+        returns. Each iterator sees every change."""
+        listener = asyncio.Queue()
+        self._listeners.append(listener)
+        try:
+            while True:
+                snapshot = await listener.get()
+                if snapshot is None:
+                    return
+                yield snapshot
+        finally:
+            self._listeners.remove(listener)
+
+    def _queue_frame(self, data, priority=PRIORITY_NORMAL, timeout=None):
+        data['sent'] = self._loop.create_future()
+        self._last_queued = super()._queue_frame(data, priority, timeout)
+        return self._last_queued
+
+    def _frame_sent(self, data):
+        future = data.get('sent')
+        if future is not None and not future.done():
+            future.set_result(True)
+
+    def _frame_dropped(self, data):
+        super()._frame_dropped(data)
+        future = data.get('sent')
+        if future is not None and not future.done():
+            future.set_result(False)
+
+    async def send_key(self, key, priority=PRIORITY_NORMAL, timeout=None):
+        """Sends a key; returns True once it has been written to the bus,
+        or False if it was dropped because the timeout passed."""
+        super().send_key(key, priority, timeout)
+        return await self._last_queued['sent']
+
+    async def set_state(self, state, enable, priority=PRIORITY_NORMAL,
+                        timeout=None):
+        """Set the state; returns True once the request has been written
+        to the bus or has cancelled out a pending one, or False if the
+        state can't be set or the timeout passed before it was sent."""
+        self._last_queued = None
+        if not super().set_state(state, enable, priority, timeout):
+            return False
+        if self._last_queued is not None:
+            return await self._last_queued['sent']
+        return True
+
+    async def request_state(self, state, enable, priority=PRIORITY_NORMAL,
+                            timeout=None):
+        """Set the state; returns True once the LEDs confirm the change,
+        or False if the state can't be set or the change was dropped or
+        not confirmed after all retries."""
+        return await asyncio.wrap_future(
+            self._request_state(state, enable, priority, timeout))
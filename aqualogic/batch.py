@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""Batch decoding of raw bus captures into columns.
+
+decode_capture() memory maps a capture in the format of tests/data/*.bin,
+finds the frames with the same FrameScanner the live decoder uses, and
+returns one row per frame in array.array columns. Values a frame doesn't
+carry are NaN in float columns and -1 in integer ones. The columns
+support the buffer protocol, so numpy.frombuffer() and the like can use
+them without a copy."""
+
+from array import array
+import mmap
+import os
+
+from .codec import decode_frame
+from .core import AquaLogic
+from .decoder import FrameScanner
+from . import display
+
+# Column name, array typecode and the value for frames that don't carry it
+COLUMNS = (
+    ('offset', 'q', -1),            # Offset of the frame's DLE STX
+    ('frame_type', 'H', 0),         # As a big-endian integer
+    ('states', 'q', -1),            # LEDs on or flashing
+    ('flashing_states', 'q', -1),
+    ('pump_speed', 'i', -1),        # From pump speed requests
+    ('pump_power', 'i', -1),
+    ('air_temp', 'd', float('nan')),
+    ('pool_temp', 'd', float('nan')),
+    ('spa_temp', 'd', float('nan')),
+    ('pool_chlorinator', 'd', float('nan')),
+    ('spa_chlorinator', 'd', float('nan')),
+    ('salt_level', 'd', float('nan')),
+    ('is_metric', 'b', -1),
+)
+
+_MISSING = tuple(missing for _, _, missing in COLUMNS)
+_INDEX = {name: index for index, (name, _, _) in enumerate(COLUMNS)}
+_DISPLAY_COLUMNS = {name: _INDEX[name] for name in (
+    'air_temp', 'pool_temp', 'spa_temp', 'pool_chlorinator',
+    'spa_chlorinator', 'salt_level', 'is_metric')}
+
+_LEDS = int.from_bytes(AquaLogic.FRAME_TYPE_LEDS, byteorder='big')
+_DISPLAY_UPDATE = int.from_bytes(AquaLogic.FRAME_TYPE_DISPLAY_UPDATE,
+                                 byteorder='big')
+_LONG_DISPLAY_UPDATE = int.from_bytes(
+    AquaLogic.FRAME_TYPE_LONG_DISPLAY_UPDATE, byteorder='big')
+_PUMP_SPEED_REQUEST = int.from_bytes(AquaLogic.FRAME_TYPE_PUMP_SPEED_REQUEST,
+                                     byteorder='big')
+_PUMP_STATUS = int.from_bytes(AquaLogic.FRAME_TYPE_PUMP_STATUS,
+                              byteorder='big')
+
+
+_BAD_CRC = -1
+_SKIPPED = -2
+_SEEN_SIZE = 4096
+
+
+def _bcd(byte):
+    return ((byte & 0xf0) >> 4) * 10 + (byte & 0x0f)
+
+
+class FrameColumns():
+    """Columns of decoded frames, plus counts of the problems seen.
+    truncated is True if the data ended part way through a frame."""
+
+    def __init__(self):
+        self._arrays = [array(typecode) for _, typecode, _ in COLUMNS]
+        for (name, _, _), column in zip(COLUMNS, self._arrays):
+            setattr(self, name, column)
+        self.bad_crc = 0
+        self.resyncs = 0
+        self.discarded = 0
+        self.truncated = False
+
+    def __len__(self):
+        return len(self.offset)
+
+    def columns(self):
+        """Returns a dict of column names to arrays."""
+        return {name: getattr(self, name) for name, _, _ in COLUMNS}
+
+    def extend(self, other):
+        """Appends the rows and counts of other."""
+        for column, other_column in zip(self._arrays, other._arrays):
+            column.extend(other_column)
+        self.bad_crc += other.bad_crc
+        self.resyncs += other.resyncs
+        self.discarded += other.discarded
+
+    @classmethod
+    def _from_rows(cls, offsets, row_ids, rows):
+        """Builds the columns from the frame offsets and, for each
+        frame, the index of its values in rows."""
+        columns = cls()
+        columns.offset.extend(offsets)
+        for index, column in enumerate(columns._arrays[1:]):
+            values = [row[index] for row in rows]
+            column.extend(map(values.__getitem__, row_ids))
+        return columns
+
+
+def _frame_row(frame):
+    """Returns the values of every column but offset for a frame."""
+    frame_type = (frame[0] << 8) | frame[1]
+    row = list(_MISSING)
+    row[1] = frame_type
+    if frame_type == _LEDS:
+        flashing_states = int.from_bytes(frame[6:10], byteorder='little')
+        row[2] = (int.from_bytes(frame[2:6], byteorder='little') |
+                  flashing_states)
+        row[3] = flashing_states
+    elif frame_type in (_DISPLAY_UPDATE, _LONG_DISPLAY_UPDATE):
+        decode = (display.decode_display if frame_type == _DISPLAY_UPDATE
+                  else display.decode_long_display)
+        for name, value in decode(frame[2:])[1]:
+            index = _DISPLAY_COLUMNS.get(name)
+            if index is not None:
+                row[index] = value
+    elif frame_type == _PUMP_SPEED_REQUEST:
+        row[4] = int.from_bytes(frame[2:4], byteorder='big')
+    elif frame_type == _PUMP_STATUS and len(frame) >= 7:
+        # As in process(), only the power is kept; it is in BCD
+        row[5] = _bcd(frame[5]) * 100 + _bcd(frame[6])
+    return tuple(row[1:])
+
+
+def decode_buffer(buf, start=0, end=None, frame_types=None):
+    """Decodes the frames in buf (any buffer supporting find(), such as
+    bytes or an mmap) whose data lies between start and end. frame_types
+    is an optional collection of FRAME_TYPE_* values to keep rows for;
+    by default every frame gets a row."""
+    # pylint: disable=too-many-locals
+    if frame_types is not None:
+        frame_types = {bytes(frame_type) for frame_type in frame_types}
+    if end is None:
+        end = len(buf)
+    scanner = FrameScanner(start)
+    offsets = array('q')
+    row_ids = array('L')
+    rows = []
+    # The bus repeats a few frames (keep-alives, LEDs, display screens)
+    # over and over, so each distinct raw frame is only decoded once.
+    seen = {}
+    bad_crc = 0
+    for frame_start, frame_stop in scanner.scan(buf, end):
+        raw = buf[frame_start:frame_stop]
+        row_id = seen.get(raw)
+        if row_id is None:
+            frame = decode_frame(raw)
+            if frame is None:
+                row_id = _BAD_CRC
+            elif frame_types is not None and frame[0:2] not in frame_types:
+                row_id = _SKIPPED
+            else:
+                row_id = len(rows)
+                rows.append(_frame_row(frame))
+            if len(seen) >= _SEEN_SIZE:
+                seen.clear()
+            seen[raw] = row_id
+        if row_id >= 0:
+            offsets.append(frame_start - 2)
+            row_ids.append(row_id)
+        elif row_id == _BAD_CRC:
+            bad_crc += 1
+    columns = FrameColumns._from_rows(offsets, row_ids, rows)
+    columns.bad_crc = bad_crc
+    columns.resyncs = scanner.resyncs
+    # Including anything after the last complete frame
+    columns.discarded = scanner.discarded + end - scanner.consumed()
+    columns.truncated = scanner.start >= 0
+    return columns
+
+
+def decode_capture(path, start=0, end=None, frame_types=None):
+    """Memory maps the capture at path and decodes the frames between
+    byte offsets start and end; see decode_buffer()."""
+    with open(path, 'rb') as capture:
+        if os.fstat(capture.fileno()).st_size == 0:
+            return FrameColumns()
+        with mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return decode_buffer(buf, start, end, frame_types)
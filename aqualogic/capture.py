@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Timestamped bus captures: recording and replay.
+
+A capture file starts with MAGIC, followed by one record per chunk of
+data as it was read from the bus: a little-endian 64-bit count of
+nanoseconds since the capture started, a 32-bit length and the data."""
+
+import struct
+import threading
+import time
+
+MAGIC = b'AQLCAP\x01\n'
+
+_RECORD = struct.Struct('<QI')
+
+
+class CaptureRecorder():
+    """Writes chunks of bus data to a capture file with the
+    time.monotonic() time each was recorded. It may be closed from
+    another thread than the one writing; chunks written after that are
+    ignored."""
+
+    def __init__(self, file):
+        """file is a path or a binary file object opened for writing."""
+        if hasattr(file, 'write'):
+            self._file = file
+            self._owns_file = False
+        else:
+            self._file = open(file, 'wb')
+            self._owns_file = True
+        self._file.write(MAGIC)
+        self._start = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        """Records a chunk of data."""
+        now = time.monotonic_ns()
+        with self._lock:
+            if self._closed:
+                return
+            if self._start is None:
+                self._start = now
+            self._file.write(_RECORD.pack(now - self._start, len(data)))
+            self._file.write(data)
+
+    def close(self):
+        """Flushes the capture, closing the file if it was opened here."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._owns_file:
+                self._file.close()
+            else:
+                self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_capture(file):
+    """Yields (seconds since the capture started, data) for each chunk
+    in a capture; file is a path or a binary file object."""
+    if not hasattr(file, 'read'):
+        with open(file, 'rb') as capture:
+            yield from read_capture(capture)
+        return
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not an AquaLogic capture file')
+    while True:
+        header = file.read(_RECORD.size)
+        if len(header) < _RECORD.size:
+            return
+        offset, length = _RECORD.unpack(header)
+        data = file.read(length)
+        if len(data) < length:
+            # Truncated by a recorder that didn't finish
+            return
+        yield offset / 1e9, data
+
+
+class ReplayReader():
+    """Reader that plays back a capture, for AquaLogic.connect_replay().
+
+    With speed=1.0 chunks are delivered with their recorded timing,
+    with larger values proportionally faster, and with speed=None as
+    fast as possible. Raises EOFError at the end of the capture."""
+
+    def __init__(self, file, speed=None):
+        self._chunks = read_capture(file)
+        self._speed = speed
+        self._start = None
+
+    def read(self):
+        """Returns the next chunk, waiting until it is due."""
+        try:
+            offset, data = next(self._chunks)
+        except StopIteration:
+            raise EOFError()
+        if self._speed is not None:
+            now = time.monotonic()
+            if self._start is None:
+                self._start = now - offset / self._speed
+            delay = self._start + offset / self._speed - now
+            if delay > 0:
+                time.sleep(delay)
+        return data
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Checksum and byte stuffing for AquaLogic bus frames.
+
+Data framing (from the AQ-CO-SERIAL manual):
+
+Each frame begins with a DLE (10H) and STX (02H) character start
+sequence, followed by a 2 to 61 byte long Command/Data field, a
+2-byte Checksum and a DLE (10H) and ETX (03H) character end
+sequence.
+
+The DLE, STX and Command/Data fields are added together to
+provide the 2-byte Checksum. If any of the bytes of the
+Command/Data Field or Checksum are equal to the DLE character
+(10H), a NULL character (00H) is inserted into the transmitted
+data stream immediately after that byte. That NULL character
+must then be removed by the receiver."""
+
+FRAME_DLE = 0x10
+FRAME_STX = 0x02
+FRAME_ETX = 0x03
+
+FRAME_START = bytes([FRAME_DLE, FRAME_STX])
+FRAME_END = bytes([FRAME_DLE, FRAME_ETX])
+
+_DLE = bytes([FRAME_DLE])
+_DLE_NULL = bytes([FRAME_DLE, 0])
+
+
+def checksum(data):
+    """Returns the checksum of a Command/Data field."""
+    return FRAME_DLE + FRAME_STX + sum(memoryview(data))
+
+
+def stuff(data):
+    """Inserts a NULL after each DLE."""
+    return bytes(data).replace(_DLE, _DLE_NULL)
+
+
+def unstuff(data):
+    """Removes the byte following each DLE in a received frame."""
+    if data.count(_DLE) == data.count(_DLE_NULL):
+        return bytes(data.replace(_DLE_NULL, _DLE))
+    # Something other than a NULL follows a DLE; drop it anyway as
+    # the byte-at-a-time reader always did.
+    result = bytearray()
+    pos = 0
+    while True:
+        index = data.find(_DLE, pos)
+        if index < 0:
+            result += data[pos:]
+            return bytes(result)
+        result += data[pos:index + 1]
+        pos = index + 2
+
+
+def encode_frame(data):
+    """Returns the complete frame for a Command/Data field, including
+    the start and end sequences."""
+    data = bytes(data)
+    crc = checksum(data).to_bytes(2, byteorder='big')
+    return FRAME_START + stuff(data + crc) + FRAME_END
+
+
+def decode_frame(raw):
+    """Unstuffs the bytes between a frame's start and end sequences and
+    verifies the checksum. Returns the Command/Data field, or None if
+    the checksum doesn't match."""
+    frame = unstuff(raw)
+    view = memoryview(frame)
+    frame_crc = int.from_bytes(view[-2:], byteorder='big')
+    if frame_crc != checksum(view[:-2]):
+        return None
+    return frame[:-2]
@@ -3,28 +3,42 @@
 pool controller."""
 
 from enum import IntEnum, unique
-from threading import Timer
+from concurrent.futures import Future
 import binascii
 import logging
-import queue
 import socket
 import time
 import serial
-import datetime
 
 from .states import States
 from .keys import Keys
+from .reader import SocketReader, SerialReader, IOReader
+from .capture import CaptureRecorder, ReplayReader
+from .codec import FRAME_DLE, FRAME_STX, FRAME_ETX, encode_frame
+from .decoder import FrameDecoder
+from .scheduler import (SendScheduler, ConfirmationTracker, PRIORITY_HIGH,
+                        PRIORITY_NORMAL)
+from . import display
+from .events import ChangeEvent, Subscription
+from .snapshot import PanelSnapshot
+from .metrics import PanelMetrics
+from .history import HistoryRing, HISTORY_FIELDS
+from .statecache import load_state, save_state
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def _ignore_data_changed(panel):
+    pass
+
+
 class AquaLogic():
     """Hayward/Goldline AquaLogic/ProLogic pool controller."""
 
     # pylint: disable=too-many-instance-attributes
-    FRAME_DLE = 0x10
-    FRAME_STX = 0x02
-    FRAME_ETX = 0x03
+    FRAME_DLE = FRAME_DLE
+    FRAME_STX = FRAME_STX
+    FRAME_ETX = FRAME_ETX
 
     READ_TIMEOUT = 10
 
@@ -43,30 +57,52 @@ class AquaLogic():
     FRAME_TYPE_PUMP_SPEED_REQUEST = b'\x0c\x01'
     FRAME_TYPE_PUMP_STATUS = b'\x00\x0c'
 
+    # Fields that must have been reported for the state to be complete
+    COMPLETE_STATE_FIELDS = ('states', 'air_temp', 'heater_auto_mode')
+
     def __init__(self):
         self._socket = None
         self._serial = None
         self._io = None
-        self._is_metric = False
-        self._air_temp = None
-        self._pool_temp = None
-        self._spa_temp = None
-        self._pool_chlorinator = None
-        self._spa_chlorinator = None
-        self._salt_level = None
-        self._check_system_msg = None
-        self._pump_speed = None
-        self._pump_power = None
-        self._states = 0
-        self._flashing_states = 0
-        self._send_queue = queue.Queue()
-        self._multi_speed_pump = False
-        self._heater_auto_mode = True  # Assume the heater is in auto mode
-        self._super_chlor_time_remain = '00:00'
-        self._display = None
-        self._configmenu = False
+        self._reader = None
+        self._recorder = None
+        self._read_time = None
+        self._led_frames = 0    # LED frames received
+        self._decoder = FrameDecoder()
+        self._metrics = PanelMetrics()
+        self._hooks = None
+        self._history = {}
+        # Panel state is published as an immutable snapshot; fields
+        # changed while processing a frame are staged and published
+        # together once the frame is done.
+        self._snapshot = PanelSnapshot.initial()
+        self._staged = {}
+        self._deferred_callbacks = 0
+        self._send_queue = SendScheduler(self._frame_dropped)
+        self._confirmations = ConfirmationTracker()
         self._tx_wait_for_keepalive = True
         self._tx_retry_enabled = True
+        self._key_event_frames = KEY_EVENT_FRAMES[
+            self.FRAME_TYPE_LOCAL_WIRED_KEY_EVENT]
+        self._change_callback = None
+        self._subscriptions = ()
+        self._track_changes = False
+        self._change_debounce = 0.0
+        self._changes = {}
+        self._changes_time = None
+        # When data first arrived and each field was first reported
+        self._started_at = None
+        self._unseen = set(PanelSnapshot._fields) - {
+            'stale_fields', 'timestamp', 'monotonic'}
+        self._first_seen = {}
+        self._complete_fields = set(self.COMPLETE_STATE_FIELDS)
+        self._completed_at = None
+        # Fields restored from the state cache until they are reported
+        self._state_cache = None
+        self._state_cache_interval = None
+        self._state_saved_at = None
+        self._stale = set()
+        self._stale_reported_at = {}
 
     def connect(self, host, port, tx_wait_for_keepalive = True, tx_retry_enabled= True):
         self.connect_socket(host, port, tx_wait_for_keepalive, tx_retry_enabled)
@@ -79,7 +115,7 @@ class AquaLogic():
             _LOGGER.info('Socket Error (Connect): %s',error)
         self._socket.connect((host, port))
         self._socket.settimeout(self.READ_TIMEOUT)
-        self._read = self._read_byte_from_socket
+        self._reader = SocketReader(self._socket)
         self._write = self._write_to_socket
         self._tx_wait_for_keepalive = tx_wait_for_keepalive
         self._tx_retry_enabled = tx_retry_enabled
@@ -88,7 +124,7 @@ class AquaLogic():
     def connect_serial(self, serial_port_name, tx_wait_for_keepalive = True, tx_retry_enabled = True):
         self._serial = serial.Serial(port=serial_port_name, baudrate=19200,
                           stopbits=serial.STOPBITS_TWO, timeout=self.READ_TIMEOUT)
-        self._read = self._read_byte_from_serial
+        self._reader = SerialReader(self._serial)
         self._write = self._write_to_serial
         self._tx_wait_for_keepalive = tx_wait_for_keepalive
         self._tx_retry_enabled = tx_retry_enabled
@@ -96,40 +132,29 @@ class AquaLogic():
     # Test connect point
     def connect_io(self, io):
         self._io = io
-        self._read = self._read_byte_from_io
+        self._reader = IOReader(self._io)
         self._write = self._write_to_io
 
-    def _check_state(self, data):
-        desired_states = data['desired_states']
-        for desired_state in desired_states:
-            if (self.get_state(desired_state['state']) !=
-                    desired_state['enabled']):
-                # The state hasn't changed
-                data['retries'] -= 1
-                if data['retries'] != 0:
-                    # Re-queue the request
-                    _LOGGER.info('requeue')
-                    self._send_queue.put(data)
-                    return
-            else:
-                _LOGGER.debug('state change successful')
+    def connect_replay(self, file, speed=None):
+        """Replays a capture made with start_capture(); speed=1.0 plays it
+        back in real time and None as fast as possible. Frames the panel
+        would send are discarded."""
+        self._reader = ReplayReader(file, speed)
+        self._write = self._write_to_nothing
+
+    def start_capture(self, file):
+        """Records the data read from the bus, with timestamps, to file
+        (a path or binary file object) until stop_capture() is called."""
+        self.stop_capture()
+        self._recorder = CaptureRecorder(file)
+
+    def stop_capture(self):
+        """Stops recording the data read from the bus."""
+        recorder = self._recorder
+        self._recorder = None
+        if recorder is not None:
+            recorder.close()
 
-    def _read_byte_from_socket(self):
-        data = self._socket.recv(1)
-        return data[0]
-    
-    def _read_byte_from_serial(self):
-        data = self._serial.read(1)
-        if len(data) == 0:
-            raise serial.SerialTimeoutException()
-        return data[0]
-        
-    def _read_byte_from_io(self):
-        data = self._io.read(1)
-        if len(data) == 0:
-            raise EOFError()
-        return data[0]
-    
     def _write_to_socket(self, data):
         self._socket.send(data)
     
@@ -139,411 +164,662 @@ class AquaLogic():
         
     def _write_to_io(self, data):
         self._io.write(data)
+
+    def _write_to_nothing(self, data):
+        pass
         
-    def _send_frame(self):
-        if not self._send_queue.empty():
-            data = self._send_queue.get(block=False)
+    def _send_frame(self, received_time):
+        """Sends the next queued frame in response to a frame received
+        at received_time."""
+        data = self._send_queue.get()
+        while data is not None and self._already_set(data):
+            data = self._send_queue.get()
+        if data is not None:
             self._write(data['frame'])
-            _LOGGER.info('%3.3f: Sent: %s', time.monotonic(),
+            now = time.monotonic()
+            self._metrics.keep_alive_to_send.observe(now - received_time)
+            data['sends'] = data.get('sends', 0) + 1
+            _LOGGER.info('%3.3f: Sent: %s', now,
                          binascii.hexlify(data['frame']))
 
-            if self._tx_retry_enabled:
-                try:
-                    if data['desired_states'] is not None:
-                        # Set a timer to verify the state changes
-                        # Wait 2 seconds as it can take a while for
-                        # the state to change.
-                        Timer(2.0, self._check_state, [data]).start()
-                except KeyError:
-                    pass
-
-    def process(self, data_changed_callback):
+            self._frame_sent(data)
+
+            if data.get('desired_states') is not None:
+                # Verify the state changes as later LED frames come in
+                self._confirmations.add(data, time.monotonic(),
+                                        self._led_frames)
+
+    def _already_set(self, data):
+        """Returns True, resolving it, if the LEDs already show the
+        states a state change request wants, as pressing the key would
+        then undo them."""
+        desired_states = data.get('desired_states')
+        if not desired_states or not all(
+                self._led_state(desired['state']) == desired['enabled']
+                for desired in desired_states):
+            return False
+        _LOGGER.info('Not sending, state already set')
+        self._send_queue.finished(data)
+        # Its outcome is as if it had been sent and confirmed
+        self._frame_sent(data)
+        self._resolve(data, True)
+        return True
+
+    def _frame_sent(self, data):
+        """Called after a queued frame has been written to the bus."""
+
+    def _frame_dropped(self, data):
+        """Called when a queued frame's deadline passed before it
+        could be sent, or it was cancelled out by a later request."""
+        self._resolve(data, False)
+
+    @staticmethod
+    def _resolve(data, result):
+        future = data.get('confirmed')
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def _share_outcome(self, data, queued):
+        future = queued.get('confirmed')
+        if future is None:
+            self._resolve(data, False)
+        else:
+            future.add_done_callback(
+                lambda done: self._resolve(data, done.result()))
+
+    def _check_confirmations(self):
+        """Resolves sent state changes the LEDs now confirm, and retries
+        or fails those that weren't confirmed in time."""
+        now = time.monotonic()
+        metrics = self._metrics
+        for data in self._confirmations.confirm(self._led_state, now,
+                                                self._led_frames):
+            _LOGGER.debug('state change successful')
+            metrics.confirmation_latency.observe(now - data['sent_at'])
+            metrics.retries.observe(data['sends'] - 1)
+            self._send_queue.finished(data)
+            self._resolve(data, True)
+        for data in self._confirmations.expire(now):
+            # The state hasn't changed
+            data['retries'] -= 1
+            if self._tx_retry_enabled and data['retries'] > 0:
+                # Re-queue the request ahead of new ones
+                _LOGGER.info('requeue')
+                queued = self._send_queue.put(data, PRIORITY_HIGH,
+                                              data['deadline'])
+                if queued is None:
+                    # Cancelled out a pending request for the opposite
+                    # change, so this one won't happen
+                    self._resolve(data, False)
+                elif queued is not data:
+                    # Merged into a pending request; share its outcome
+                    self._share_outcome(data, queued)
+            else:
+                _LOGGER.info('state change not confirmed')
+                metrics.retries.observe(data['sends'] - 1)
+                self._send_queue.finished(data)
+                self._resolve(data, False)
+
+    def confirmation_stats(self):
+        """Returns a dict of state changes in flight, confirmed and timed
+        out, and their command to confirmation latency."""
+        return self._confirmations.stats()
+
+    def _queue_frame(self, data, priority=PRIORITY_NORMAL, timeout=None):
+        """Queues a frame to be sent; returns the queued request, or
+        None if it cancelled out a pending one."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Queue it to send immediately following the reception
+        # of a keep-alive packet in an attempt to avoid bus collisions.
+        return self._send_queue.put(data, priority, deadline)
+
+    def send_queue_stats(self):
+        """Returns a dict of send queue depth, wait times and counts of
+        sent, merged, cancelled and expired requests."""
+        return self._send_queue.stats()
+
+    def stats(self):
+        """Returns a dict of bus and transmit metrics: counters, the
+        send queue depth, and histograms (dicts with count, sum, mean and
+        cumulative buckets) of keep-alive to send delay, retries per state
+        change and confirmation latency."""
+        metrics = self._metrics
+        decoder = self._decoder
+        return {
+            'bytes_read': metrics.bytes_read,
+            'frames': {FRAME_TYPE_NAMES.get(frame_type,
+                                            frame_type.hex()): count
+                       for frame_type, count in metrics.frames.items()},
+            'bad_crc': decoder.bad_crc,
+            'resyncs': decoder.resyncs,
+            'discarded_bytes': decoder.discarded,
+            'unknown_frames': metrics.unknown_frames,
+            'time_to_complete_state':
+                self.state_timing()['time_to_complete_state'],
+            'send_queue_depth': self._send_queue.qsize(),
+            'keep_alive_to_send': metrics.keep_alive_to_send.stats(),
+            'retries': metrics.retries.stats(),
+            'confirmation_latency': metrics.confirmation_latency.stats(),
+        }
+
+    def process(self, data_changed_callback=None):
         """Process data; returns when the reader signals EOF.
         Callback is notified when any data changes."""
-        # pylint: disable=too-many-locals,too-many-branches,too-many-statements
+        if data_changed_callback is None:
+            data_changed_callback = _ignore_data_changed
         try:
+            frame_rx_time = time.monotonic()
             while True:
-                # Data framing (from the AQ-CO-SERIAL manual):
-                #
-                # Each frame begins with a DLE (10H) and STX (02H) character start
-                # sequence, followed by a 2 to 61 byte long Command/Data field, a
-                # 2-byte Checksum and a DLE (10H) and ETX (03H) character end
-                # sequence.
-                #
-                # The DLE, STX and Command/Data fields are added together to
-                # provide the 2-byte Checksum. If any of the bytes of the
-                # Command/Data Field or Checksum are equal to the DLE character
-                # (10H), a NULL character (00H) is inserted into the transmitted
-                # data stream immediately after that byte. That NULL character
-                # must then be removed by the receiver.
-
-                byte = self._read()
-                frame_start_time = None
-
-                frame_rx_time = datetime.datetime.now()
-
-                while True:
-                    # Search for FRAME_DLE + FRAME_STX
-                    if byte == self.FRAME_DLE:
-                        frame_start_time = time.monotonic()
-                        next_byte = self._read()
-                        if next_byte == self.FRAME_STX:
-                            break
-                        else:
-                            continue
-                    byte = self._read()
-                    elapsed = datetime.datetime.now() - frame_rx_time
-                    if elapsed.seconds > self.READ_TIMEOUT:
-                        _LOGGER.info('Frame timeout')
-                        return
-
-                frame = bytearray()
-                byte = self._read()
-
-                while True:
-                    if byte == self.FRAME_DLE:
-                        # Should be FRAME_ETX or 0 according to
-                        # the AQ-CO-SERIAL manual
-                        next_byte = self._read()
-                        if next_byte == self.FRAME_ETX:
-                            break
-                        elif next_byte != 0:
-                            # Error?
-                            pass
-
-                    frame.append(byte)
-                    byte = self._read()
-
-                # Verify CRC
-                frame_crc = int.from_bytes(frame[-2:], byteorder='big')
-                frame = frame[:-2]
-
-                calculated_crc = self.FRAME_DLE + self.FRAME_STX
-                for byte in frame:
-                    calculated_crc += byte
-
-                if frame_crc != calculated_crc:
-                    _LOGGER.warning('Bad CRC')
-                    continue
-
-                frame_type = frame[0:2]
-                frame = frame[2:]
-
-                if self._tx_wait_for_keepalive:
-                    if frame_type == self.FRAME_TYPE_KEEP_ALIVE:
-                        # Keep alive
-                        # _LOGGER.debug('%3.3f: KA', frame_start_time)
-
-                        # If a frame has been queued for transmit, send it.
-                        if not self._send_queue.empty():
-                            self._send_frame()
-
-                        continue
-                else:
-                   self._send_frame()
-
-                if frame_type == self.FRAME_TYPE_LOCAL_WIRED_KEY_EVENT:
-                    _LOGGER.debug('%3.3f: Local Wired Key: %s',
-                                  frame_start_time, binascii.hexlify(frame))
-                elif frame_type == self.FRAME_TYPE_REMOTE_WIRED_KEY_EVENT:
-                    _LOGGER.debug('%3.3f: Remote Wired Key: %s',
-                                  frame_start_time, binascii.hexlify(frame))
-                elif frame_type == self.FRAME_TYPE_WIRELESS_KEY_EVENT:
-                    _LOGGER.debug('%3.3f: Wireless Key: %s',
-                                  frame_start_time, binascii.hexlify(frame))
-                elif frame_type == self.FRAME_TYPE_LEDS:
-                    # _LOGGER.debug('%3.3f: LEDs: %s',
-                    #              frame_start_time, binascii.hexlify(frame))
-                    # First 4 bytes are the LEDs that are on;
-                    # second 4 bytes_ are the LEDs that are flashing
-                    states = int.from_bytes(frame[0:4], byteorder='little')
-                    flashing_states = int.from_bytes(frame[4:8],
-                                                     byteorder='little')
-                    states |= flashing_states
-                    if self._heater_auto_mode:
-                        states |= States.HEATER_AUTO_MODE
-                    if (states != self._states or
-                            flashing_states != self._flashing_states):
-                        self._states = states
-                        self._flashing_states = flashing_states
-                        data_changed_callback(self)
-                elif frame_type == self.FRAME_TYPE_PUMP_SPEED_REQUEST:
-                    value = int.from_bytes(frame[0:2], byteorder='big')
-                    _LOGGER.debug('%3.3f: Pump speed request: %d%%',
-                                  frame_start_time, value)
-                    if self._pump_speed != value:
-                        self._pump_speed = value
-                        data_changed_callback(self)
-                elif ((frame_type == self.FRAME_TYPE_PUMP_STATUS) and
-                      (len(frame) >= 5)):
-                    # Pump status messages sent out by Hayward VSP pumps
-                    self._multi_speed_pump = True
-                    speed = frame[2]
-                    # Power is in BCD
-                    power = ((((frame[3] & 0xf0) >> 4) * 1000) +
-                             (((frame[3] & 0x0f)) * 100) +
-                             (((frame[4] & 0xf0) >> 4) * 10) +
-                             (((frame[4] & 0x0f))))
-                    _LOGGER.debug('%3.3f; Pump speed: %d%%, power: %d watts',
-                                  frame_start_time, speed, power)
-                    if self._pump_power != power:
-                        self._pump_power = power
-                        data_changed_callback(self)
-                elif frame_type == self.FRAME_TYPE_DISPLAY_UPDATE:
-                    # Convert LCD-specific degree symbol and decode to utf-8
-                    text = self._convert_to_string(frame)
-                    
-                    _LOGGER.debug('%3.3f: Display update: %s',
-                                  frame_start_time, text)
-
-                    if self._display != text:
-                        self._display = text
-                        data_changed_callback(self)
-
-                    parts = text.split()
-                    
-                    try:
-                        if parts[0] == 'Pool' and parts[1] == 'Temp':
-                            # Pool Temp <temp>°[C|F]
-                            value = int(parts[2][:-2])
-                            if self._pool_temp != value:
-                                self._pool_temp = value
-                                self._is_metric = parts[2][-1:] == 'C'
-                                data_changed_callback(self)
-
-                        elif parts[0] == 'Spa' and parts[1] == 'Temp':
-                            # Spa Temp <temp>°[C|F]
-                            value = int(parts[2][:-2])
-                            if self._spa_temp != value:
-                                self._spa_temp = value
-                                self._is_metric = parts[2][-1:] == 'C'
-                                data_changed_callback(self)
-
-                        elif parts[0] == 'Air' and parts[1] == 'Temp':
-                            # Air Temp <temp>°[C|F]
-                            value = int(parts[2][:-2])
-                            if self._air_temp != value:
-                                self._air_temp = value
-                                self._is_metric = parts[2][-1:] == 'C'
-                                data_changed_callback(self)
-
-                        elif parts[0] == 'Pool' and parts[1] == 'Chlorinator':
-                            # Pool Chlorinator <value>%
-                            value = int(parts[2][:-1])
-                            if self._pool_chlorinator != value:
-                                self._pool_chlorinator = value
-                                data_changed_callback(self)
-
-                        elif parts[0] == 'Spa' and parts[1] == 'Chlorinator':
-                            # Spa Chlorinator <value>%
-                            value = int(parts[2][:-1])
-                            if self._spa_chlorinator != value:
-                                self._spa_chlorinator = value
-                                data_changed_callback(self)
-
-                        elif parts[0] == 'Salt' and parts[1] == 'Level':
-                            # Salt Level <value> [g/L|PPM|
-                            value = float(parts[2])
-                            if self._salt_level != value:
-                                self._salt_level = value
-                                self._is_metric = parts[3] == 'g/L'
-                                data_changed_callback(self)
-
-                        elif parts[0] == 'Check' and parts[1] == 'System':
-                            # Check System <msg>
-                            value = ' '.join(parts[2:])
-                            if self._check_system_msg != value:
-                                self._check_system_msg = value
-                                data_changed_callback(self)
-
-                        elif (parts[0] == 'Chlorinator' and parts[1] == 'Off' and 
-                            parts[2] == 'No' and parts[3] == 'Flow'):
-                            # Possible pressure issue
-                            value = ' '.join(parts[2:])
-                            if self._check_system_msg != value:
-                                self._check_system_msg = value
-                                data_changed_callback(self)
-
-                        elif (len(parts) > 3 and parts[0] == 'Super' and parts[1] == 'Chlorinate' and
-                            parts[3] == 'remaining'):
-                            # Super chlorination <value> remaining
-                            value = parts[2].replace(" ","")
-                            value = value.replace("Âº",":")
-                            if self._super_chlor_time_remain != value:
-                                self._super_chlor_time_remain = value
-                                data_changed_callback(self)
-
-                        elif parts[0] == 'Configuration' and parts[1] == 'Menu-Locked':
-                            self._configmenu = True
-
-                        elif parts[0] == 'Heater1':
-                            # P4 heater mode
-                            value = parts[1] == 'Auto'
-                            if value != self._heater_auto_mode:
-                                self._heater_auto_mode = value
-                                data_changed_callback(self)
-
-                        elif parts[0] == 'Gas' and parts[1] == 'Heater':
-                            # P8 heater mode
-                            # Gas Heater [Auto|Manual]
-                            value = parts[2] == 'Auto'
-                            if self._heater_auto_mode != value:
-                                self._heater_auto_mode = value
-                                data_changed_callback(self)
-
-                    except ValueError:
-                        pass
-                elif frame_type == self.FRAME_TYPE_LONG_DISPLAY_UPDATE:
-                    # Not currently parsed
-                    pass
-                else:
-                    _LOGGER.debug('%3.3f: Unknown frame: %s %s',
-                                 frame_start_time,
-                                 binascii.hexlify(frame_type),
-                                 binascii.hexlify(frame))
+                data = self._reader.read()
+                read_time = time.monotonic()
+                if self._process_data(data, data_changed_callback,
+                                      read_time):
+                    frame_rx_time = read_time
+                elif time.monotonic() - frame_rx_time > self.READ_TIMEOUT:
+                    _LOGGER.info('Frame timeout')
+                    return
         except socket.timeout:
             _LOGGER.info("socket timeout")
         except serial.SerialTimeoutException:
             _LOGGER.info("serial timeout")
         except EOFError:
             _LOGGER.info("eof")
+        finally:
+            if self._changes:
+                # Deliver what is still waiting out the debounce period
+                self._flush_changes(force=True)
+            self.save_state_cache()
+
+    def _process_data(self, data, data_changed_callback, read_time=None):
+        """Decodes a chunk of bus data read at read_time (by default now)
+        and processes the frames in it. Returns the number of frames
+        processed."""
+        self._read_time = (time.monotonic() if read_time is None
+                           else read_time)
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.write(data)
+        metrics = self._metrics
+        metrics.bytes_read += len(data)
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        if self._hooks is not None:
+            return self._process_data_hooked(data, data_changed_callback)
+        count = 0
+        for frame in self._decoder.feed(data):
+            metrics.frames[frame.frame_type] += 1
+            self._process_frame(frame.frame_type, frame.payload,
+                                self._defer_data_changed)
+            self._frame_done(data_changed_callback)
+            count += 1
+        return count
+
+    def _frame_done(self, data_changed_callback):
+        """Publishes what a frame changed, then notifies callbacks and
+        checks confirmations and subscriptions against it."""
+        if self._staged:
+            self._publish()
+        while self._deferred_callbacks:
+            self._deferred_callbacks -= 1
+            data_changed_callback(self)
+        if self._confirmations:
+            self._check_confirmations()
+        if self._changes:
+            self._flush_changes()
+
+    def _process_data_hooked(self, data, data_changed_callback):
+        """The frame loop of _process_data() with calls to the profiling
+        hooks around each stage."""
+        hooks = self._hooks
+        metrics = self._metrics
+        frames = self._decoder.feed(data)
+        count = 0
+        while True:
+            hooks.frame_start()
+            frame = next(frames, None)
+            if frame is None:
+                return count
+            frame_type = frame.frame_type
+            hooks.frame_decoded(frame_type)
+            metrics.frames[frame_type] += 1
+            self._process_frame(frame_type, frame.payload,
+                                self._defer_data_changed)
+            hooks.frame_dispatched(frame_type)
+            self._frame_done(data_changed_callback)
+            hooks.callbacks_done(frame_type)
+            count += 1
+
+    def set_profiling_hooks(self, hooks):
+        """Calls hooks (see profiling.ProfilingHooks) as each frame
+        is decoded and handled; None removes them."""
+        self._hooks = hooks
+
+    def set_change_callback(self, callback, debounce=0.0):
+        """Delivers changes as one ChangeEvent per frame, or per debounce
+        seconds if debounce is given, to callback(event) instead of one
+        data changed callback per field. None stops delivery.
+
+        A debounce window is only closed when the next frame arrives."""
+        self._change_callback = callback
+        self._change_debounce = debounce
+        self._changes = {}
+        self._track_changes = (callback is not None or
+                               bool(self._subscriptions))
+
+    def subscribe(self, callback, fields=None, states=0):
+        """Registers callback(event) for ChangeEvents that change any of
+        the named PanelSnapshot fields (e.g. 'pool_temp', 'pump_power') or
+        any of the States in the states bitmask (e.g.
+        States.AUX_1 | States.LIGHTS). With neither, every change is
+        delivered. Events are coalesced as set_change_callback()
+        describes. Returns a Subscription to pass to unsubscribe()."""
+        if fields is not None:
+            unknown = set(fields) - set(PanelSnapshot._fields)
+            if unknown:
+                raise ValueError('Unknown fields {}'.format(sorted(unknown)))
+        subscription = Subscription(callback, fields, states)
+        # Copied on write so the reader can iterate without a lock
+        self._subscriptions = self._subscriptions + (subscription,)
+        self._track_changes = True
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stops delivering events to a subscription."""
+        self._subscriptions = tuple(sub for sub in self._subscriptions
+                                    if sub is not subscription)
+        self._track_changes = (self._change_callback is not None or
+                               bool(self._subscriptions))
+
+    def _defer_data_changed(self, panel):
+        # Data changed callbacks are made once the frame's changes have
+        # been published, so that they see them all.
+        self._deferred_callbacks += 1
+
+    def _publish(self):
+        timestamp = time.time()
+        self._snapshot = self._snapshot._replace(
+            timestamp=timestamp, monotonic=time.monotonic(), **self._staged)
+        if self._history:
+            for name, value in self._staged.items():
+                ring = self._history.get(name)
+                if ring is not None and value is not None:
+                    ring.append(timestamp, value)
+        self._staged = {}
+        if (self._state_cache is not None and
+                self._snapshot.monotonic - self._state_saved_at >=
+                self._state_cache_interval):
+            self.save_state_cache()
+
+    def enable_history(self, size=1024, fields=None):
+        """Keeps the last size changes of each of the named numeric
+        PanelSnapshot fields (by default those in history.HISTORY_FIELDS)
+        with their time.time() timestamps, for history() to query."""
+        history = {}
+        for name in fields if fields is not None else HISTORY_FIELDS:
+            if name not in HISTORY_FIELDS:
+                raise ValueError('No history for {}'.format(name))
+            ring = HistoryRing(size, HISTORY_FIELDS[name])
+            value = getattr(self._snapshot, name)
+            if value is not None:
+                ring.append(self._snapshot.timestamp or time.time(), value)
+            history[name] = ring
+        self._history = history
+
+    def set_state_cache(self, path, save_interval=60.0, max_age=None):
+        """Keeps the panel's last known state in a cache file at path,
+        saved at most every save_interval seconds and when process()
+        returns. Call before connecting: the values in the cache last
+        reported no more than max_age seconds ago are restored straight
+        away and listed in the snapshot's stale_fields until the panel
+        reports them; until then they are saved with the time they were
+        last reported. Returns True if the cache was restored."""
+        self._state_cache = path
+        self._state_cache_interval = save_interval
+        self._state_saved_at = time.monotonic()
+        cached = load_state(path, max_age)
+        if cached is None:
+            return False
+        timestamp, fields = cached
+        # Never overwrite anything already reported
+        fields = {name: field for name, field in fields.items()
+                  if name in self._unseen}
+        values = {name: field[0] for name, field in fields.items()}
+        self._stale_reported_at = {name: field[1]
+                                   for name, field in fields.items()
+                                   if field[0] is not None}
+        self._stale = set(self._stale_reported_at)
+        self._snapshot = self._snapshot._replace(
+            stale_fields=frozenset(self._stale), timestamp=timestamp,
+            **values)
+        _LOGGER.info('Restored state cache %s', path)
+        return True
 
-    def _convert_to_string(self, frame):
-        length = len(frame) - 1 # Exclude null terminator
-        lineLength = length // 2
-        topLine = self._convert_lcd_chars(frame[:lineLength+1])
-        bottomLine = self._convert_lcd_chars(frame[lineLength:])
-
-        if len(bottomLine) == 0:
-            return topLine
+    def save_state_cache(self):
+        """Saves the state cache set by set_state_cache() now, if
+        anything has been reported since the panel was restored."""
+        if self._state_cache is None or self._snapshot.monotonic is None:
+            return
+        self._state_saved_at = time.monotonic()
+        try:
+            save_state(self._state_cache, self._snapshot,
+                       {name: self._stale_reported_at[name]
+                        for name in self._stale})
+        except OSError as error:
+            _LOGGER.warning('Failed to save state cache %s: %s',
+                            self._state_cache, error)
 
-        return topLine + "\n" + bottomLine
+    def history(self, name):
+        """Returns the HistoryRing of a field enable_history() records."""
+        return self._history[name]
 
-    def _convert_lcd_chars(self, data):
-        text = ""
-
-        # Remove any other non-ASCII characters
-        for i in range(0, len(data) - 1):
-            if data[i] < 0x20:
-                continue
-            elif data[i] >= 0x20 and data[i] <= 0x7f:
-                text += chr(data[i])
-            elif data[i] > 0x7f:
-                # Convert known Hitachi-like LCD characters to UTF-8
-                if data[i] == 0xdf: # Degree symbol
-                    text += "\u00b0"
-
-        return text.strip()
-
-    def _append_data(self, frame, data):
-        for byte in data:
-            frame.append(byte)
-            if byte == self.FRAME_DLE:
-                frame.append(0)
+    @property
+    def snapshot(self):
+        """Returns a PanelSnapshot of the panel's current state."""
+        return self._snapshot
+
+    def _update(self, name, value):
+        """Stages a field for publishing; returns True if its value
+        changed."""
+        if name in self._unseen:
+            self._field_seen(name)
+        staged = self._staged
+        old = staged[name] if name in staged else getattr(self._snapshot,
+                                                          name)
+        if old == value:
+            return False
+        staged[name] = value
+        if self._track_changes:
+            if not self._changes:
+                self._changes_time = time.monotonic()
+            previous = self._changes.get(name)
+            if previous is not None:
+                old = previous[0]
+            if old == value:
+                # Changed back within the window
+                del self._changes[name]
+            else:
+                self._changes[name] = (old, value)
+        return True
 
-    def _get_key_event_frame(self, key):
-        frame = bytearray()
-        frame.append(self.FRAME_DLE)
-        frame.append(self.FRAME_STX)
-
-        if key.value > 0xffff:
-            self._append_data(frame, self.FRAME_TYPE_WIRELESS_KEY_EVENT)
-            self._append_data(frame, b'\x01')
-            self._append_data(frame, key.value.to_bytes(4, byteorder='little'))
-            self._append_data(frame, key.value.to_bytes(4, byteorder='little'))
-            self._append_data(frame, b'\x00')
+    def _field_seen(self, name):
+        now = time.monotonic()
+        self._unseen.discard(name)
+        self._first_seen[name] = now
+        if name in self._stale:
+            self._stale.discard(name)
+            self._staged['stale_fields'] = frozenset(self._stale)
+        if (self._completed_at is None and
+                self._complete_fields.issubset(self._first_seen)):
+            self._completed_at = now
+
+    def set_complete_state_fields(self, fields):
+        """Sets the PanelSnapshot fields that must have been reported
+        for the state to be complete, for installations that show more
+        or fewer than COMPLETE_STATE_FIELDS."""
+        self._complete_fields = set(fields)
+        self._completed_at = None
+        if self._complete_fields.issubset(self._first_seen):
+            self._completed_at = max(
+                (self._first_seen[name] for name in self._complete_fields),
+                default=self._started_at)
+
+    def state_timing(self):
+        """Returns how long after data first arrived the state became
+        complete (None until it is) and each field was first reported,
+        in seconds."""
+        started_at = self._started_at
+        return {
+            'time_to_complete_state': (
+                None if self._completed_at is None
+                else self._completed_at - started_at),
+            'fields': {name: seen - started_at
+                       for name, seen in self._first_seen.items()},
+        }
+
+    def _flush_changes(self, force=False):
+        """Delivers the pending changes once the debounce period has
+        passed, or straight away if force is set."""
+        now = time.monotonic()
+        if not force and now - self._changes_time < self._change_debounce:
+            return
+        changes = self._changes
+        self._changes = {}
+        event = ChangeEvent(self, changes, now)
+        if self._change_callback is not None:
+            self._change_callback(event)
+        if self._subscriptions:
+            changed_states = self._changed_states(changes)
+            for subscription in self._subscriptions:
+                if subscription.matches(changes, changed_states):
+                    subscription.callback(event)
+
+    def _changed_states(self, changes):
+        """Returns a bitmask of the States that changed."""
+        if 'states' not in changes and 'flashing_states' not in changes:
+            return 0
+        snapshot = self._snapshot
+        old_states, new_states = changes.get(
+            'states', (snapshot.states, snapshot.states))
+        old_flashing, new_flashing = changes.get(
+            'flashing_states',
+            (snapshot.flashing_states, snapshot.flashing_states))
+        changed = old_states ^ new_states
+        if (old_flashing ^ new_flashing) & States.FILTER:
+            # FILTER_LOW_SPEED is shown by the FILTER LED flashing
+            changed |= States.FILTER_LOW_SPEED
+        return changed
+
+    def _process_frame(self, frame_type, frame, data_changed_callback):
+        """Processes a single decoded frame."""
+        # pylint: disable=too-many-branches,too-many-statements
+        received_time = self._read_time
+
+        if self._tx_wait_for_keepalive:
+            if frame_type == self.FRAME_TYPE_KEEP_ALIVE:
+                # Keep alive
+                # _LOGGER.debug('%3.3f: KA', received_time)
+
+                # If a frame has been queued for transmit, send it.
+                if not self._send_queue.empty():
+                    self._send_frame(received_time)
+
+                return
+        else:
+           self._send_frame(received_time)
+
+        if frame_type == self.FRAME_TYPE_LOCAL_WIRED_KEY_EVENT:
+            _LOGGER.debug('%3.3f: Local Wired Key: %s',
+                          received_time, binascii.hexlify(frame))
+        elif frame_type == self.FRAME_TYPE_REMOTE_WIRED_KEY_EVENT:
+            _LOGGER.debug('%3.3f: Remote Wired Key: %s',
+                          received_time, binascii.hexlify(frame))
+        elif frame_type == self.FRAME_TYPE_WIRELESS_KEY_EVENT:
+            _LOGGER.debug('%3.3f: Wireless Key: %s',
+                          received_time, binascii.hexlify(frame))
+        elif frame_type == self.FRAME_TYPE_LEDS:
+            # _LOGGER.debug('%3.3f: LEDs: %s',
+            #              received_time, binascii.hexlify(frame))
+            # First 4 bytes are the LEDs that are on;
+            # second 4 bytes_ are the LEDs that are flashing
+            self._led_frames += 1
+            states = int.from_bytes(frame[0:4], byteorder='little')
+            flashing_states = int.from_bytes(frame[4:8],
+                                             byteorder='little')
+            states |= flashing_states
+            if self._snapshot.heater_auto_mode:
+                states |= States.HEATER_AUTO_MODE
+            changed = self._update('states', states)
+            if self._update('flashing_states', flashing_states):
+                changed = True
+            if changed:
+                data_changed_callback(self)
+        elif frame_type == self.FRAME_TYPE_PUMP_SPEED_REQUEST:
+            value = int.from_bytes(frame[0:2], byteorder='big')
+            _LOGGER.debug('%3.3f: Pump speed request: %d%%',
+                          received_time, value)
+            if self._update('pump_speed', value):
+                data_changed_callback(self)
+        elif ((frame_type == self.FRAME_TYPE_PUMP_STATUS) and
+              (len(frame) >= 5)):
+            # Pump status messages sent out by Hayward VSP pumps
+            self._update('multi_speed_pump', True)
+            speed = frame[2]
+            # Power is in BCD
+            power = ((((frame[3] & 0xf0) >> 4) * 1000) +
+                     (((frame[3] & 0x0f)) * 100) +
+                     (((frame[4] & 0xf0) >> 4) * 10) +
+                     (((frame[4] & 0x0f))))
+            _LOGGER.debug('%3.3f; Pump speed: %d%%, power: %d watts',
+                          received_time, speed, power)
+            if self._update('pump_power', power):
+                data_changed_callback(self)
+        elif frame_type == self.FRAME_TYPE_DISPLAY_UPDATE:
+            # Convert LCD-specific degree symbol and decode to utf-8;
+            # repeated screens are served from the display cache.
+            text, values = display.decode_display(frame)
+
+            _LOGGER.debug('%3.3f: Display update: %s',
+                          received_time, text)
+
+            if self._update('display', text):
+                data_changed_callback(self)
+
+            self._apply_display_values(values, data_changed_callback)
+        elif frame_type == self.FRAME_TYPE_LONG_DISPLAY_UPDATE:
+            # Holds several screens at once, so their values are known
+            # without waiting for the display to rotate past them.
+            texts, values = display.decode_long_display(frame)
+
+            _LOGGER.debug('%3.3f: Long display update: %s',
+                          received_time, ' | '.join(texts))
+
+            self._apply_display_values(values, data_changed_callback)
         else:
-            self._append_data(frame, self.FRAME_TYPE_LOCAL_WIRED_KEY_EVENT)
-            self._append_data(frame, key.value.to_bytes(2, byteorder='little'))
-            self._append_data(frame, key.value.to_bytes(2, byteorder='little'))
+            self._metrics.unknown_frames += 1
+            _LOGGER.debug('%3.3f: Unknown frame: %s %s',
+                         received_time,
+                         binascii.hexlify(frame_type),
+                         binascii.hexlify(frame))
+
+    def _apply_display_values(self, values, data_changed_callback):
+        """Stores (name, value) pairs parsed from the display; notifies
+        the callback once if any of them changed."""
+        changed = False
+        for name, value in values:
+            if self._update(name, value):
+                changed = True
+        if changed:
+            data_changed_callback(self)
 
-        crc = 0
-        for byte in frame:
-            crc += byte
-        self._append_data(frame, crc.to_bytes(2, byteorder='big'))
+    def _convert_to_string(self, frame):
+        return display.convert_to_string(frame)
 
-        frame.append(self.FRAME_DLE)
-        frame.append(self.FRAME_ETX)
+    def _convert_lcd_chars(self, data):
+        return display.convert_lcd_chars(data)
+
+    @classmethod
+    def _build_key_event_frame(cls, key, source):
+        """Builds the frame for a key event from the given source;
+        keys beyond the wired panels' 16 bits always use the wireless
+        frame layout."""
+        if key.value > 0xffff or source == cls.FRAME_TYPE_WIRELESS_KEY_EVENT:
+            data = (cls.FRAME_TYPE_WIRELESS_KEY_EVENT + b'\x01' +
+                    key.value.to_bytes(4, byteorder='little') +
+                    key.value.to_bytes(4, byteorder='little') + b'\x00')
+        else:
+            data = (source +
+                    key.value.to_bytes(2, byteorder='little') +
+                    key.value.to_bytes(2, byteorder='little'))
 
-        return frame
+        return encode_frame(data)
 
-    def send_key(self, key):
-        """Sends a key."""
+    def _get_key_event_frame(self, key):
+        return self._key_event_frames[key]
+
+    def set_key_event_source(self, source):
+        """Selects which panel sent key events appear to come from: one of
+        FRAME_TYPE_LOCAL_WIRED_KEY_EVENT (the default),
+        FRAME_TYPE_REMOTE_WIRED_KEY_EVENT or FRAME_TYPE_WIRELESS_KEY_EVENT."""
+        if source not in KEY_EVENT_FRAMES:
+            raise ValueError('Unknown key event source {}'.format(source))
+        self._key_event_frames = KEY_EVENT_FRAMES[source]
+
+    def send_key(self, key, priority=PRIORITY_NORMAL, timeout=None):
+        """Sends a key. Keys are sent in priority order; if timeout is
+        given the key is dropped when it can't be sent within timeout
+        seconds."""
         _LOGGER.info('Queueing key %s', key)
         frame = self._get_key_event_frame(key)
-
-        # Queue it to send immediately following the reception
-        # of a keep-alive packet in an attempt to avoid bus collisions.
-        self._send_queue.put({'frame': frame})
+        self._queue_frame({'frame': frame}, priority, timeout)
 
     @property
     def air_temp(self):
         """Returns the current air temperature, or None if unknown."""
-        return self._air_temp
+        return self._snapshot.air_temp
 
     @property
     def pool_temp(self):
         """Returns the current pool temperature, or None if unknown."""
-        return self._pool_temp
+        return self._snapshot.pool_temp
 
     @property
     def spa_temp(self):
         """Returns the current spa temperature, or None if unknown."""
-        return self._spa_temp
+        return self._snapshot.spa_temp
 
     @property
     def pool_chlorinator(self):
         """Returns the current pool chlorinator level in %,
         or None if unknown."""
-        return self._pool_chlorinator
+        return self._snapshot.pool_chlorinator
 
     @property
     def spa_chlorinator(self):
         """Returns the current spa chlorinator level in %,
         or None if unknown."""
-        return self._spa_chlorinator
+        return self._snapshot.spa_chlorinator
 
     @property
     def salt_level(self):
         """Returns the current salt level, or None if unknown."""
-        return self._salt_level
+        return self._snapshot.salt_level
 
     @property
     def check_system_msg(self):
         """Returns the current 'Check System' message, or None if unknown."""
         if self.get_state(States.CHECK_SYSTEM):
-            return self._check_system_msg
+            return self._snapshot.check_system_msg
         return None
 
     @property
     def status(self):
         """Returns 'OK' or the current 'Check System' message."""
         if self.get_state(States.CHECK_SYSTEM):
-            return self._check_system_msg
+            return self._snapshot.check_system_msg
         return 'OK'
 
     @property
     def display(self):
         """Returns Display messages."""
-        return self._display
+        return self._snapshot.display
 
     @property
     def pump_speed(self):
         """Returns the current pump speed in percent, or None if unknown.
            Requires a Hayward VSP pump connected to the AquaLogic bus."""
-        return self._pump_speed
+        return self._snapshot.pump_speed
 
     @property
     def pump_power(self):
         """Returns the current pump power in watts, or None if unknown.
            Requires a Hayward VSP pump connected to the AquaLogic bus."""
-        return self._pump_power
+        return self._snapshot.pump_power
 
     @property
     def is_metric(self):
         """Returns True if the temperature and salt level values
         are in Metric."""
-        return self._is_metric
+        return self._snapshot.is_metric
 
     @property
     def is_heater_enabled(self):
@@ -554,7 +830,7 @@ class AquaLogic():
     def super_chlorinate_time_remaining(self):
         """Returns time remaining if super chlorinate is on"""
         if self.get_state(States.SUPER_CHLORINATE):
-            return self._super_chlor_time_remain
+            return self._snapshot.super_chlor_time_remain
         return '00:00'
 
     @property
@@ -563,42 +839,63 @@ class AquaLogic():
         return self.get_state(States.SUPER_CHLORINATE)
 
     def states(self):
-        """Returns a set containing the enabled states."""
-        state_list = []
-        for state in States:
-            if state.value & self._states != 0:
-                state_list.append(state)
-
-        if (self._flashing_states & States.FILTER) != 0:
-            state_list.append(States.FILTER_LOW_SPEED)
-
-        return state_list
+        """Returns a list containing the enabled states."""
+        return list(self._snapshot.enabled_states())
 
     def get_state(self, state):
         """Returns True if the specified state is enabled."""
         # Check to see if we have a change request pending; if we do
         # return the value we expect it to change to.
-        for data in list(self._send_queue.queue):
-            desired_states = data['desired_states']
-            for desired_state in desired_states:
-                if desired_state['state'] == state:
-                    return desired_state['enabled']
-        if state == States.FILTER_LOW_SPEED:
-            return (States.FILTER.value & self._flashing_states) != 0
-        return (state.value & self._states) != 0
-
-    def set_state(self, state, enable):
-        """Set the state."""
+        pending = self._send_queue.pending_state(state)
+        if pending is not None:
+            return pending
+        return self._led_state(state)
+
+    def _led_state(self, state):
+        """Returns True if the LEDs last received show state enabled."""
+        return self._snapshot.get_state(state)
+
+    def set_state(self, state, enable, priority=PRIORITY_NORMAL,
+                  timeout=None):
+        """Set the state. Requests are sent in priority order; one that
+        undoes a pending request cancels it. If timeout is given the
+        request is dropped when it can't be sent within timeout seconds."""
+        future = self._request_state(state, enable, priority, timeout)
+        return not future.done() or future.result()
+
+    def request_state(self, state, enable, priority=PRIORITY_NORMAL,
+                      timeout=None):
+        """Set the state as set_state() does, returning a
+        concurrent.futures.Future. Its result is True once the LEDs
+        confirm the change, or if no change was needed, and False if the
+        state can't be set or the change was dropped or not confirmed
+        after all retries."""
+        return self._request_state(state, enable, priority, timeout)
+
+    @staticmethod
+    def _completed(result):
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def _request_state(self, state, enable, priority, timeout):
+        # pylint: disable=too-many-return-statements
+        stale = self._snapshot.stale_fields
+        if stale and ('states' in stale or 'flashing_states' in stale or (
+                state == States.HEATER_AUTO_MODE and
+                'heater_auto_mode' in stale)):
+            # Keys toggle, so the current state must be known
+            return self._completed(False)
 
         is_enabled = self.get_state(state)
         if is_enabled == enable:
-            return True
+            return self._completed(True)
 
         key = None
 
         if state == States.FILTER_LOW_SPEED:
-            if not self._multi_speed_pump:
-                return False
+            if not self._snapshot.multi_speed_pump:
+                return self._completed(False)
             # Send the FILTER key once.
             # If the pump is in high speed, it wil switch to low speed.
             # If the pump is off the retry mechanism will send an additional
@@ -612,15 +909,16 @@ class AquaLogic():
         elif state == States.HEATER_AUTO_MODE:
             key = Keys.HEATER_1
             # Flip the heater mode
-            desired_states = [{'state': States.HEATER_AUTO_MODE,
-                               'enabled': not self._heater_auto_mode}]
+            desired_states = [{
+                'state': States.HEATER_AUTO_MODE,
+                'enabled': not self._snapshot.heater_auto_mode}]
         elif state == States.POOL or state == States.SPA:
             key = Keys.POOL_SPA
             desired_states = [{'state': state, 'enabled': not is_enabled}]
         elif state == States.HEATER_1:
             # TODO: is there a way to force the heater on?
             # Perhaps press & hold?
-            return False
+            return self._completed(False)
         else:
             # See if this state has a corresponding Key
             try:
@@ -628,19 +926,39 @@ class AquaLogic():
             except KeyError:
                 # TODO: send the appropriate combination of keys
                 # to enable the state
-                return False
+                return self._completed(False)
             desired_states = [{'state': state, 'enabled': not is_enabled}]
 
         frame = self._get_key_event_frame(key)
-
-        # Queue it to send immediately following the reception
-        # of a keep-alive packet in an attempt to avoid bus collisions.
-        self._send_queue.put({'frame': frame, 'desired_states': desired_states,
-                              'retries': 10})
-
-        return True
+        data = {'frame': frame, 'desired_states': desired_states,
+                'retries': 10, 'confirmed': Future()}
+        queued = self._queue_frame(data, priority, timeout)
+        if queued is None:
+            # Cancelled out a pending request for the opposite change
+            data['confirmed'].set_result(True)
+            return data['confirmed']
+        # If merged into a pending request, share its outcome
+        return queued.get('confirmed', data['confirmed'])
 
     def enable_multi_speed_pump(self, enable):
         """Enables multi-speed pump mode."""
-        self._multi_speed_pump = enable
+        self._snapshot = self._snapshot._replace(multi_speed_pump=enable)
         return True
+
+
+# Frames for every key from each source, built once; sending a key
+# is then a dict lookup.
+KEY_EVENT_FRAMES = {
+    source: {key: AquaLogic._build_key_event_frame(key, source)
+             for key in Keys}
+    for source in (AquaLogic.FRAME_TYPE_LOCAL_WIRED_KEY_EVENT,
+                   AquaLogic.FRAME_TYPE_REMOTE_WIRED_KEY_EVENT,
+                   AquaLogic.FRAME_TYPE_WIRELESS_KEY_EVENT)
+}
+
+# Names of the known frame types, e.g. 'keep_alive', for stats()
+FRAME_TYPE_NAMES = {
+    value: name[len('FRAME_TYPE_'):].lower()
+    for name, value in vars(AquaLogic).items()
+    if name.startswith('FRAME_TYPE_')
+}
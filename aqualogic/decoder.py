@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Incremental decoder for AquaLogic bus frames."""
+
+from collections import namedtuple
+import logging
+
+from .codec import FRAME_DLE, FRAME_STX, FRAME_ETX, FRAME_START, decode_frame
+
+_LOGGER = logging.getLogger(__name__)
+
+Frame = namedtuple('Frame', ['frame_type', 'payload'])
+
+# mmap.find() only takes bytes
+_DLE = bytes([FRAME_DLE])
+
+
+class FrameScanner():
+    """Finds frame boundaries in a buffer without copying it.
+
+    scan() can be called again on the same buffer after more data has
+    been appended, and resumes where it stopped; pos is where scanning
+    will resume and start the offset of the DLE STX of a frame whose end
+    hasn't been seen yet, or -1."""
+
+    def __init__(self, pos=0):
+        self.pos = pos
+        self.start = -1
+        self.resyncs = 0
+        self.discarded = 0
+
+    def consumed(self):
+        """Returns the offset before which the buffer is no longer
+        needed."""
+        return self.pos if self.start < 0 else self.start
+
+    def rebase(self, offset):
+        """Adjusts the positions after offset bytes were removed from
+        the front of the buffer."""
+        self.pos -= offset
+        if self.start >= 0:
+            self.start -= offset
+
+    def scan(self, buf, end=None):
+        """Yields (start, stop) for each frame completed in buf before
+        end; buf[start:stop] is the stuffed data between its DLE STX and
+        DLE ETX."""
+        if end is None:
+            end = len(buf)
+        pos = self.pos
+        start = self.start
+        while True:
+            if start < 0:
+                # Search for FRAME_DLE + FRAME_STX
+                start = buf.find(FRAME_START, pos, end)
+                if start < 0:
+                    # Keep a trailing DLE; it may be followed by STX
+                    keep = (end - 1 if end > pos and buf[end - 1] == FRAME_DLE
+                            else end)
+                    self.discarded += keep - pos
+                    self.pos = keep
+                    self.start = -1
+                    return
+                self.discarded += start - pos
+                pos = start + 2
+
+            index = buf.find(_DLE, pos, end)
+            if index < 0 or index + 1 >= end:
+                # Wait for more data
+                self.pos = end if index < 0 else index
+                self.start = start
+                return
+
+            next_byte = buf[index + 1]
+            if next_byte == FRAME_ETX:
+                self.pos = index + 2
+                self.start = -1
+                yield start + 2, index
+                start = -1
+                pos = index + 2
+            elif next_byte == FRAME_STX:
+                # A new frame started before this one ended; resync.
+                self.resyncs += 1
+                self.discarded += index - start
+                start = index
+                pos = index + 2
+            else:
+                # Should be 0 according to the AQ-CO-SERIAL manual
+                pos = index + 2
+
+
+class FrameDecoder():
+    """Push-style frame decoder.
+
+    Bytes are passed to feed() in chunks of any size; complete frames
+    are yielded as Frame(frame_type, payload) tuples and partial frames
+    are held until the rest of their bytes arrive.
+
+    bad_crc, resyncs and discarded (bytes skipped looking for a frame
+    start or dropped with an unfinished frame) count problems seen on
+    the bus."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanner = FrameScanner()
+        self.bad_crc = 0
+
+    @property
+    def resyncs(self):
+        return self._scanner.resyncs
+
+    @property
+    def discarded(self):
+        return self._scanner.discarded
+
+    def reset(self):
+        """Discards any partially received frame."""
+        self._compact()
+        self._scanner.discarded += len(self._buffer)
+        self._buffer = bytearray()
+        self._scanner.pos = 0
+        self._scanner.start = -1
+
+    def _compact(self):
+        consumed = self._scanner.consumed()
+        if consumed:
+            del self._buffer[:consumed]
+            self._scanner.rebase(consumed)
+
+    def feed(self, data):
+        """Adds data to the decoder; returns an iterator over the frames
+        it completes. Frames left unread are returned by the next call."""
+        # Frames handed out by the last call are only removed now, so
+        # the buffer is trimmed once per call rather than per frame.
+        self._compact()
+        self._buffer += data
+        return self._frames(self._buffer)
+
+    def _frames(self, buf):
+        for start, stop in self._scanner.scan(buf):
+            frame = self._check_frame(buf[start:stop])
+            if frame is not None:
+                yield frame
+            else:
+                self.bad_crc += 1
+
+    @staticmethod
+    def _check_frame(raw):
+        frame = decode_frame(raw)
+        if frame is None:
+            _LOGGER.warning('Bad CRC')
+            return None
+        return Frame(frame[0:2], frame[2:])
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""Decoding and parsers for the text shown on the AquaLogic display.
+
+Each parser is registered against the leading words of the display
+text and returns a dict of the values it extracted, keyed on the
+PanelSnapshot field name."""
+
+from functools import lru_cache
+import logging
+
+from .snapshot import PanelSnapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+DISPLAY_CACHE_SIZE = 128
+
+# Fields a parser may set; the rest are managed by AquaLogic
+_PARSED_FIELDS = frozenset(PanelSnapshot._fields) - {
+    'display', 'stale_fields', 'timestamp', 'monotonic'}
+
+_PARSERS = {}
+_TOKEN_COUNTS = []
+
+
+def display_parser(*tokens):
+    """Decorator registering a parser for display text starting with
+    the given words. The parser is called with the list of words and
+    returns a dict of extracted values keyed on PanelSnapshot field
+    names, others being logged and ignored; a parser registered for more
+    words takes precedence over one registered for fewer."""
+    def register(func):
+        _PARSERS[tokens] = func
+        if len(tokens) not in _TOKEN_COUNTS:
+            _TOKEN_COUNTS.append(len(tokens))
+            _TOKEN_COUNTS.sort(reverse=True)
+        # Cached results may have been parsed without this parser
+        decode_display.cache_clear()
+        decode_long_display.cache_clear()
+        return func
+    return register
+
+
+def remove_display_parser(*tokens):
+    """Unregisters the parser registered for the given words."""
+    del _PARSERS[tokens]
+    _TOKEN_COUNTS[:] = sorted({len(words) for words in _PARSERS},
+                              reverse=True)
+    decode_display.cache_clear()
+    decode_long_display.cache_clear()
+
+
+def parse_display(text):
+    """Returns a dict of the values extracted from display text."""
+    parts = text.split()
+    for count in _TOKEN_COUNTS:
+        parser = _PARSERS.get(tuple(parts[:count]))
+        if parser is not None:
+            try:
+                values = parser(parts) or {}
+            except (ValueError, IndexError):
+                return {}
+            if not _PARSED_FIELDS.issuperset(values):
+                _LOGGER.warning('Ignoring unknown fields from %s parser: %s',
+                                ' '.join(parts[:count]),
+                                ', '.join(sorted(set(values) -
+                                                 _PARSED_FIELDS)))
+                values = {name: value for name, value in values.items()
+                          if name in _PARSED_FIELDS}
+            return values
+    return {}
+
+
+def convert_to_string(frame):
+    """Converts a display update frame to text; the top and bottom
+    lines are separated by a newline."""
+    length = len(frame) - 1 # Exclude null terminator
+    lineLength = length // 2
+    topLine = convert_lcd_chars(frame[:lineLength+1])
+    bottomLine = convert_lcd_chars(frame[lineLength:])
+
+    if len(bottomLine) == 0:
+        return topLine
+
+    return topLine + "\n" + bottomLine
+
+
+# Characters 0xe0-0xff of the Hitachi HD44780 A00 character ROM
+_LCD_E0_FF = ['α', 'ä', 'β', 'ε', 'μ', 'σ', 'ρ', 'g',
+              '√', '⁻¹', 'j', 'ˣ', '¢', '£', 'ñ', 'ö',
+              'p', 'q', 'θ', '∞', 'Ω', 'ü', 'Σ', 'π',
+              'x̄', 'y', '千', '万', '円', '÷', ' ', '█']
+
+
+def _build_lcd_table():
+    """Builds a str.translate table from LCD character codes (as
+    latin-1 decoded characters) to text."""
+    table = {}
+    # Drop control characters; 0x20-0x7f is passed through as ASCII
+    for byte in range(0x00, 0x20):
+        table[byte] = None
+    for byte in range(0x80, 0xa0):
+        table[byte] = None
+    table[0xa0] = ' '
+    # 0xa1-0xdf are JIS X 0201 katakana, which map onto the Unicode
+    # halfwidth forms in order.
+    for byte in range(0xa1, 0xe0):
+        table[byte] = chr(0xff61 + byte - 0xa1)
+    # The panels use the semi-voiced sound mark as a degree symbol
+    table[0xdf] = '\u00b0'
+    for byte, char in enumerate(_LCD_E0_FF, 0xe0):
+        table[byte] = char
+    return table
+
+
+LCD_TABLE = _build_lcd_table()
+
+
+def convert_lcd_chars(data):
+    """Converts LCD characters to text, ignoring the last byte."""
+    return str(data[:-1], 'latin-1').translate(LCD_TABLE).strip()
+
+
+def _decode_display(payload):
+    text = convert_to_string(payload)
+    return text, tuple(parse_display(text).items())
+
+
+def _decode_long_display(payload):
+    # Long display updates hold the text of several screens, each
+    # terminated by a null; control characters are dropped with the
+    # rest of the non-printing characters.
+    texts = []
+    values = {}
+    for screen in payload.split(b'\x00'):
+        text = convert_lcd_chars(screen + b'\x00')
+        if text:
+            texts.append(text)
+            values.update(parse_display(text))
+    return tuple(texts), tuple(values.items())
+
+
+def _cached(maxsize, func=_decode_display):
+    return lru_cache(maxsize=maxsize)(func)
+
+
+# decode_display(payload) returns the display text and a tuple of the
+# (name, value) pairs parsed from it, memoized on the raw payload bytes
+# since the panel cycles through the same few screens.
+decode_display = _cached(DISPLAY_CACHE_SIZE)
+
+# decode_long_display(payload) returns a tuple of the text of each screen
+# in a long display update and the (name, value) pairs parsed from them.
+decode_long_display = _cached(DISPLAY_CACHE_SIZE, _decode_long_display)
+
+
+def set_display_cache_size(maxsize):
+    """Replaces the display caches with empty ones of the given size;
+    None makes them unbounded and 0 disables caching."""
+    # pylint: disable=global-statement
+    global decode_display, decode_long_display
+    decode_display = _cached(maxsize)
+    decode_long_display = _cached(maxsize, _decode_long_display)
+
+
+def display_cache_info():
+    """Returns the display cache hits, misses, maxsize and currsize."""
+    return decode_display.cache_info()
+
+
+def _parse_temp(parts, name):
+    # <name> Temp <temp>°[C|F]
+    return {name: int(parts[2][:-2]), 'is_metric': parts[2][-1:] == 'C'}
+
+
+@display_parser('Pool', 'Temp')
+def _pool_temp(parts):
+    return _parse_temp(parts, 'pool_temp')
+
+
+@display_parser('Spa', 'Temp')
+def _spa_temp(parts):
+    return _parse_temp(parts, 'spa_temp')
+
+
+@display_parser('Air', 'Temp')
+def _air_temp(parts):
+    return _parse_temp(parts, 'air_temp')
+
+
+@display_parser('Pool', 'Chlorinator')
+def _pool_chlorinator(parts):
+    # Pool Chlorinator <value>%
+    return {'pool_chlorinator': int(parts[2][:-1])}
+
+
+@display_parser('Spa', 'Chlorinator')
+def _spa_chlorinator(parts):
+    # Spa Chlorinator <value>%
+    return {'spa_chlorinator': int(parts[2][:-1])}
+
+
+@display_parser('Salt', 'Level')
+def _salt_level(parts):
+    # Salt Level <value> [g/L|PPM|
+    return {'salt_level': float(parts[2]), 'is_metric': parts[3] == 'g/L'}
+
+
+@display_parser('Check', 'System')
+def _check_system(parts):
+    # Check System <msg>
+    return {'check_system_msg': ' '.join(parts[2:])}
+
+
+@display_parser('Chlorinator', 'Off')
+def _chlorinator_off(parts):
+    # Chlorinator Off No Flow; possible pressure issue
+    if parts[2] == 'No' and parts[3] == 'Flow':
+        return {'check_system_msg': ' '.join(parts[2:])}
+    return None
+
+
+@display_parser('Super', 'Chlorinate')
+def _super_chlorinate(parts):
+    # Super chlorination <value> remaining
+    if len(parts) > 3 and parts[3] == 'remaining':
+        value = parts[2].replace(" ", "")
+        value = value.replace("Âº", ":")
+        return {'super_chlor_time_remain': value}
+    return None
+
+
+@display_parser('Configuration', 'Menu-Locked')
+def _config_menu_locked(parts):
+    return {'configmenu': True}
+
+
+@display_parser('Heater1')
+def _heater1(parts):
+    # P4 heater mode
+    return {'heater_auto_mode': parts[1] == 'Auto'}
+
+
+@display_parser('Gas', 'Heater')
+def _gas_heater(parts):
+    # P8 heater mode
+    # Gas Heater [Auto|Manual]
+    return {'heater_auto_mode': parts[2] == 'Auto'}
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Change notifications for AquaLogic panels."""
+
+from collections import namedtuple
+
+# One notification for all of the fields that changed in a frame or
+# debounce window. changes maps each PanelSnapshot field name that
+# changed (e.g. 'pool_temp' or 'states') to an (old, new) tuple.
+ChangeEvent = namedtuple('ChangeEvent', ['panel', 'changes', 'timestamp'])
+
+
+class Subscription():
+    """A callback registered for changes to some fields or states."""
+
+    # pylint: disable=too-few-public-methods
+    __slots__ = ('callback', 'fields', 'states')
+
+    def __init__(self, callback, fields=None, states=0):
+        self.callback = callback
+        self.fields = None if fields is None else frozenset(fields)
+        self.states = int(states)
+
+    def matches(self, changes, changed_states):
+        """Returns True if any of the changed fields or the changed
+        States bits are ones this subscription is interested in."""
+        if self.fields is None and not self.states:
+            return True
+        if self.states & changed_states:
+            return True
+        return self.fields is not None and not self.fields.isdisjoint(changes)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Fixed-size histories of panel readings."""
+
+from array import array
+import threading
+
+# PanelSnapshot fields AquaLogic.enable_history() records by default,
+# and the array typecodes their values are kept in.
+HISTORY_FIELDS = {
+    'air_temp': 'd',
+    'pool_temp': 'd',
+    'spa_temp': 'd',
+    'pool_chlorinator': 'd',
+    'spa_chlorinator': 'd',
+    'salt_level': 'd',
+    'pump_speed': 'd',
+    'pump_power': 'd',
+    'states': 'q',
+    'flashing_states': 'q',
+}
+
+
+class HistoryRing():
+    """Ring buffer of (timestamp, value) samples held in two arrays.
+
+    Samples are appended in time order as a value changes, so each value
+    holds until the next sample. Once size samples are held each append
+    overwrites the oldest, so memory use is fixed at size times the item
+    sizes. Window queries binary search the timestamps and include the
+    value in effect at the start of the window. Safe to use from several
+    threads."""
+
+    def __init__(self, size, typecode='d'):
+        self._size = size
+        self._times = array('d', [0.0]) * size
+        self._values = array(typecode, [0]) * size
+        self._count = 0
+        self._next = 0      # Index the next sample is written at
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        """Records value at timestamp, which must not be earlier than
+        the last sample's."""
+        with self._lock:
+            index = self._next
+            self._times[index] = timestamp
+            self._values[index] = value
+            self._next = (index + 1) % self._size
+            if self._count < self._size:
+                self._count += 1
+
+    # The helpers below are called with the lock held and use logical
+    # indexes, 0 being the oldest sample held.
+
+    def _oldest(self):
+        return self._next if self._count == self._size else 0
+
+    def _bisect(self, timestamp):
+        """Returns the number of samples at or before timestamp."""
+        oldest = self._oldest()
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self._times[(oldest + mid) % self._size] <= timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _slice(self, data, first, last):
+        begin = (self._oldest() + first) % self._size
+        end = begin + last - first
+        if end <= self._size:
+            return data[begin:end]
+        return data[begin:] + data[:end - self._size]
+
+    def _window(self, start, end):
+        """Returns the logical range of the samples in effect between
+        start and end; None is unbounded."""
+        first = 0 if start is None else max(self._bisect(start) - 1, 0)
+        last = self._count if end is None else self._bisect(end)
+        return first, max(first, last)
+
+    def samples(self, start=None, end=None):
+        """Returns a list of the (timestamp, value) samples in effect
+        between start and end, beginning with the one in effect at
+        start."""
+        with self._lock:
+            first, last = self._window(start, end)
+            return list(zip(self._slice(self._times, first, last),
+                            self._slice(self._values, first, last)))
+
+    def last(self):
+        """Returns the newest (timestamp, value), or None."""
+        with self._lock:
+            if not self._count:
+                return None
+            index = self._next - 1
+            return self._times[index], self._values[index]
+
+    def last_change(self):
+        """Returns the timestamp of the newest sample whose value differs
+        from the one before it, or None if there is none held."""
+        with self._lock:
+            index = self._next - 1
+            for _ in range(self._count - 1):
+                if self._values[index - 1] != self._values[index]:
+                    return self._times[index]
+                index -= 1
+            return None
+
+    def min(self, start=None, end=None):
+        """Returns the lowest value in effect between start and end, or
+        None if there is none."""
+        with self._lock:
+            first, last = self._window(start, end)
+            return (min(self._slice(self._values, first, last))
+                    if last > first else None)
+
+    def max(self, start=None, end=None):
+        """Returns the highest value in effect between start and end, or
+        None if there is none."""
+        with self._lock:
+            first, last = self._window(start, end)
+            return (max(self._slice(self._values, first, last))
+                    if last > first else None)
+
+    def mean(self, start, end):
+        """Returns the time-weighted mean of the value between start and
+        end, or None if no sample covers any of that time."""
+        with self._lock:
+            first, last = self._window(start, end)
+            times = self._slice(self._times, first, last)
+            values = self._slice(self._values, first, last)
+        total = 0.0
+        weight = 0.0
+        for index, value in enumerate(values):
+            begin = max(times[index], start)
+            finish = times[index + 1] if index + 1 < len(times) else end
+            if finish > begin:
+                total += value * (finish - begin)
+                weight += finish - begin
+        return total / weight if weight else None
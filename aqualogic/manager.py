@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""Serves many AquaLogic panels from a single selector loop."""
+
+import errno
+import logging
+import selectors
+import socket
+import time
+import serial
+
+from .core import AquaLogic
+from .reader import BufferedReader
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _Link():
+    """Connection state for one managed panel."""
+
+    # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    def __init__(self, name, panel, address=None, serial_port_name=None):
+        self.name = name
+        self.panel = panel
+        self.address = address
+        self.serial_port_name = serial_port_name
+        self.fileobj = None
+        self.state = 'disconnected'
+        self.connected_since = None
+        self.last_frame = None
+        self.frames = 0
+        self.reconnects = 0
+        self.last_error = None
+        self.retry_delay = PanelManager.RECONNECT_DELAY_MIN
+        self.next_attempt = 0.0
+        self.connect_deadline = None
+
+
+class PanelManager():
+    """Multiplexes any number of panels over one selector.
+
+    Each registered panel is an ordinary AquaLogic instance; the manager
+    owns its connection, feeds received data to it and reconnects it
+    with exponential backoff when the link fails or goes quiet.
+    The manager is not thread-safe; register panels before calling
+    run(), or from the data changed callback."""
+
+    RECONNECT_DELAY_MIN = 1.0
+    RECONNECT_DELAY_MAX = 60.0
+    POLL_INTERVAL = 1.0
+    CONNECT_TIMEOUT = AquaLogic.READ_TIMEOUT
+
+    def __init__(self, data_changed_callback=None):
+        """Callback is called as callback(name, panel) when any data
+        of a panel changes."""
+        self._selector = selectors.DefaultSelector()
+        self._links = {}
+        self._data_changed_callback = data_changed_callback
+        self._buffer = bytearray(BufferedReader.BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._running = False
+
+    def add_socket(self, name, host, port, tx_wait_for_keepalive=True,
+                   tx_retry_enabled=True):
+        """Registers a panel reached via a RS-485 to Ethernet adapter.
+        Returns the AquaLogic instance for the panel."""
+        return self._add(_Link(name, self._create_panel(
+            tx_wait_for_keepalive, tx_retry_enabled), address=(host, port)))
+
+    def add_serial(self, name, serial_port_name, tx_wait_for_keepalive=True,
+                   tx_retry_enabled=True):
+        """Registers a panel reached via a serial port.
+        Returns the AquaLogic instance for the panel."""
+        return self._add(_Link(name, self._create_panel(
+            tx_wait_for_keepalive, tx_retry_enabled),
+                               serial_port_name=serial_port_name))
+
+    @staticmethod
+    def _create_panel(tx_wait_for_keepalive, tx_retry_enabled):
+        panel = AquaLogic()
+        panel._tx_wait_for_keepalive = tx_wait_for_keepalive
+        panel._tx_retry_enabled = tx_retry_enabled
+        return panel
+
+    def _add(self, link):
+        if link.name in self._links:
+            raise KeyError('Panel {} is already registered'.format(link.name))
+        self._links[link.name] = link
+        return link.panel
+
+    def remove(self, name):
+        """Disconnects and unregisters a panel."""
+        link = self._links.pop(name)
+        self._close(link)
+
+    def panel(self, name):
+        """Returns the AquaLogic instance for a registered panel."""
+        return self._links[name].panel
+
+    def panels(self):
+        """Returns a dict of registered panel names to AquaLogic
+        instances."""
+        return {name: link.panel for name, link in self._links.items()}
+
+    def health(self):
+        """Returns a dict of panel names to connection health."""
+        now = time.monotonic()
+        result = {}
+        for name, link in self._links.items():
+            result[name] = {
+                'state': link.state,
+                'connected_for': (now - link.connected_since
+                                  if link.connected_since is not None
+                                  else None),
+                'since_last_frame': (now - link.last_frame
+                                     if link.last_frame is not None
+                                     else None),
+                'frames': link.frames,
+                'reconnects': link.reconnects,
+                'last_error': link.last_error,
+                'retry_in': (max(link.next_attempt - now, 0.0)
+                             if link.state == 'disconnected' else None),
+            }
+        return result
+
+    def run(self):
+        """Serves all panels until stop() is called."""
+        self._running = True
+        while self._running:
+            self.poll(self.POLL_INTERVAL)
+
+    def stop(self):
+        """Makes run() return after the current poll."""
+        self._running = False
+
+    def close(self):
+        """Disconnects all panels."""
+        for link in self._links.values():
+            self._close(link)
+        self._selector.close()
+
+    def poll(self, timeout=0.0):
+        """Waits up to timeout seconds for data, processes it, and
+        services connection attempts and link timeouts."""
+        now = time.monotonic()
+        for link in list(self._links.values()):
+            if link.state == 'disconnected':
+                if now >= link.next_attempt:
+                    self._connect(link)
+                else:
+                    timeout = min(timeout, link.next_attempt - now)
+            elif link.state == 'connecting':
+                if now >= link.connect_deadline:
+                    self._failed(link, 'Connect timeout')
+                else:
+                    timeout = min(timeout, link.connect_deadline - now)
+            elif (link.state == 'connected' and
+                  now - link.last_frame > AquaLogic.READ_TIMEOUT):
+                self._failed(link, 'Frame timeout')
+
+        if not self._selector.get_map():
+            # Nothing to wait on; select() may not accept an empty set.
+            time.sleep(max(timeout, 0.0))
+            return
+
+        for key, events in self._selector.select(max(timeout, 0.0)):
+            link = key.data
+            if link.state == 'connecting':
+                self._connect_finished(link)
+            elif events & selectors.EVENT_READ:
+                self._read(link)
+
+    def _connect(self, link):
+        link.panel._decoder.reset()
+        try:
+            if link.address is not None:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                link.fileobj = sock
+                error = sock.connect_ex(link.address)
+                if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    raise OSError(error, 'Connect failed')
+                link.state = 'connecting'
+                link.connect_deadline = time.monotonic() + self.CONNECT_TIMEOUT
+                self._selector.register(sock, selectors.EVENT_WRITE, link)
+            else:
+                port = serial.Serial(port=link.serial_port_name,
+                                     baudrate=19200,
+                                     stopbits=serial.STOPBITS_TWO, timeout=0)
+                link.fileobj = port
+                link.panel._serial = port
+                link.panel._write = link.panel._write_to_serial
+                self._selector.register(port.fileno(), selectors.EVENT_READ,
+                                        link)
+                self._connected(link)
+        except (OSError, serial.SerialException) as error:
+            self._failed(link, error)
+
+    def _connect_finished(self, link):
+        sock = link.fileobj
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error != 0:
+            self._failed(link, OSError(error, 'Connect failed'))
+            return
+        self._selector.modify(sock, selectors.EVENT_READ, link)
+        link.panel._socket = sock
+        link.panel._write = link.panel._write_to_socket
+        self._connected(link)
+
+    def _connected(self, link):
+        link.state = 'connected'
+        link.connected_since = time.monotonic()
+        # Give the link a full read timeout to deliver its first frame
+        link.last_frame = link.connected_since
+        link.retry_delay = self.RECONNECT_DELAY_MIN
+        _LOGGER.info('%s: connected', link.name)
+
+    def _read(self, link):
+        try:
+            if link.address is not None:
+                count = link.fileobj.recv_into(self._view)
+            else:
+                data = link.fileobj.read(
+                    min(max(link.fileobj.in_waiting, 1), len(self._buffer)))
+                count = len(data)
+                self._buffer[:count] = data
+        except BlockingIOError:
+            # Woken up without data after all
+            return
+        except (OSError, serial.SerialException) as error:
+            self._failed(link, error)
+            return
+        if count == 0:
+            if link.address is not None:
+                self._failed(link, 'eof')
+            return
+
+        def data_changed(panel):
+            if self._data_changed_callback is not None:
+                try:
+                    self._data_changed_callback(link.name, panel)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception('%s: data changed callback failed',
+                                      link.name)
+
+        try:
+            frames = link.panel._process_data(self._view[:count],
+                                              data_changed)
+        except (OSError, serial.SerialException) as error:
+            # Raised by a write to the bus
+            self._failed(link, error)
+            return
+        if frames:
+            link.frames += frames
+            link.last_frame = time.monotonic()
+
+    def _failed(self, link, error):
+        _LOGGER.info('%s: link failed: %s; retrying in %.1fs', link.name,
+                     error, link.retry_delay)
+        self._close(link)
+        link.last_error = str(error)
+        link.reconnects += 1
+        link.next_attempt = time.monotonic() + link.retry_delay
+        link.retry_delay = min(link.retry_delay * 2, self.RECONNECT_DELAY_MAX)
+
+    def _close(self, link):
+        if link.fileobj is not None:
+            try:
+                self._selector.unregister(
+                    link.fileobj if link.address is not None
+                    else link.fileobj.fileno())
+            except (KeyError, ValueError):
+                pass
+            link.fileobj.close()
+            link.fileobj = None
+        link.state = 'disconnected'
+        link.connected_since = None
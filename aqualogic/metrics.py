@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Per-panel counters and histograms, and a Prometheus text endpoint.
+
+Recording is a few attribute increments per frame; nothing is
+formatted or aggregated until stats() or the endpoint asks for it."""
+
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+RETRY_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+# stats() values that go up and down, rather than only counting up
+GAUGES = {'send_queue_depth', 'time_to_complete_state'}
+
+
+class Histogram():
+    """Counts observations in buckets with fixed upper bounds."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        # One count per bucket plus one for values above the last bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """Records a value."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def stats(self):
+        """Returns a dict of the count, sum, mean and the cumulative
+        count of values at or below each bucket's bound."""
+        cumulative = {}
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            cumulative[bound] = total
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'buckets': cumulative,
+        }
+
+
+class PanelMetrics():
+    """The metrics AquaLogic records for one panel."""
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self):
+        self.bytes_read = 0
+        self.frames = defaultdict(int)      # Keyed on frame type
+        self.unknown_frames = 0
+        self.keep_alive_to_send = Histogram(LATENCY_BUCKETS)
+        self.retries = Histogram(RETRY_BUCKETS)
+        self.confirmation_latency = Histogram(LATENCY_BUCKETS)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in sorted(labels.items())) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text(panels, prefix='aqualogic'):
+    """Returns the stats() of each panel in a {name: panel} dict in the
+    Prometheus text exposition format."""
+    # pylint: disable=too-many-locals
+    samples = defaultdict(list)
+    types = {}
+    for name, panel in sorted(panels.items()):
+        for metric, value in panel.stats().items():
+            metric_name = '{}_{}'.format(prefix, metric)
+            if isinstance(value, dict) and 'buckets' in value:
+                types[metric_name] = 'histogram'
+                for bound, count in value['buckets'].items():
+                    samples[metric_name].append(('_bucket', {
+                        'panel': name, 'le': bound}, count))
+                samples[metric_name].append(('_bucket', {
+                    'panel': name, 'le': '+Inf'}, value['count']))
+                samples[metric_name].append(('_sum', {'panel': name},
+                                             value['sum']))
+                samples[metric_name].append(('_count', {'panel': name},
+                                             value['count']))
+            elif isinstance(value, dict):
+                # Counts broken down by a label, e.g. frames by type
+                metric_name += '_total'
+                types[metric_name] = 'counter'
+                for label, count in sorted(value.items()):
+                    samples[metric_name].append(('', {
+                        'panel': name, 'type': label}, count))
+            elif isinstance(value, (int, float)):
+                if metric in GAUGES:
+                    types[metric_name] = 'gauge'
+                else:
+                    metric_name += '_total'
+                    types[metric_name] = 'counter'
+                samples[metric_name].append(('', {'panel': name}, value))
+    lines = []
+    for metric_name, metric_samples in samples.items():
+        lines.append('# TYPE {} {}'.format(metric_name, types[metric_name]))
+        for suffix, labels, value in metric_samples:
+            lines.append('{}{}{} {}'.format(metric_name, suffix,
+                                            _labels(labels),
+                                            _format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer():
+    """Serves the metrics of a set of panels over HTTP at /metrics.
+
+    panels is a dict of names to AquaLogic instances, or a callable
+    returning one such as PanelManager.panels."""
+
+    def __init__(self, panels, host='127.0.0.1', port=9108):
+        self._panels = panels if callable(panels) else lambda: panels
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint: disable=invalid-name
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = prometheus_text(server._panels()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # pylint: disable=redefined-builtin
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        daemon=True)
+
+    def start(self):
+        """Starts serving on a background thread."""
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Stops serving."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Decoding capture archives on a pool of processes.
+
+Large captures are split into chunks at frame starts the serial scan is
+certain to resync on, each chunk is decoded by batch.decode_capture() in
+a worker process, and the columns are merged in order, so the result is
+the same as decoding the whole file in one go."""
+
+from concurrent.futures import ProcessPoolExecutor
+import mmap
+import os
+
+from .batch import FrameColumns, decode_capture
+from .codec import FRAME_DLE, FRAME_START
+
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def split_points(buf, chunk_size=CHUNK_SIZE):
+    """Returns the offsets at which buf can be split into chunks of about
+    chunk_size bytes that decode independently.
+
+    Each is the DLE of a DLE STX not preceded by another DLE. Whatever
+    state the scan is in when it reaches one, it starts a new frame there:
+    while hunting it finds it, and inside a frame it resyncs on it. The
+    only DLE that could hide it, by making it the byte after a DLE, is
+    ruled out."""
+    points = []
+    target = chunk_size
+    size = len(buf)
+    while target < size:
+        point = buf.find(FRAME_START, target)
+        while point > 0 and buf[point - 1] == FRAME_DLE:
+            point = buf.find(FRAME_START, point + 1)
+        if point < 0:
+            break
+        points.append(point)
+        target = point + chunk_size
+    return points
+
+
+def _decode_chunk(args):
+    path, start, end, frame_types = args
+    return decode_capture(path, start, end, frame_types)
+
+
+def _merge(chunks):
+    """Merges columns decoded from consecutive chunks of a capture."""
+    merged = FrameColumns()
+    for index, columns in enumerate(chunks):
+        merged.extend(columns)
+        if columns.truncated and index < len(chunks) - 1:
+            # The serial scan would have resynced on the next chunk's
+            # first frame, where this chunk's scan just stopped.
+            merged.resyncs += 1
+        merged.truncated = columns.truncated
+    return merged
+
+
+def _tasks(path, chunk_size, frame_types):
+    """Returns the decode_capture() arguments for each chunk of path."""
+    with open(path, 'rb') as capture:
+        size = os.fstat(capture.fileno()).st_size
+        if size <= chunk_size:
+            return [(path, 0, None, frame_types)]
+        with mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            points = split_points(buf, chunk_size)
+    bounds = [0] + points + [size]
+    return [(path, start, end, frame_types)
+            for start, end in zip(bounds, bounds[1:])]
+
+
+def decode_capture_parallel(path, workers=None, chunk_size=CHUNK_SIZE,
+                            frame_types=None):
+    """Decodes a capture as batch.decode_capture() does, splitting it
+    into chunks of about chunk_size bytes decoded by workers processes."""
+    tasks = _tasks(path, chunk_size, frame_types)
+    if len(tasks) == 1:
+        return _decode_chunk(tasks[0])
+    with ProcessPoolExecutor(workers) as pool:
+        return _merge(list(pool.map(_decode_chunk, tasks)))
+
+
+def decode_captures(paths, workers=None, chunk_size=CHUNK_SIZE,
+                    frame_types=None):
+    """Decodes many captures on one pool of workers processes; returns a
+    list of FrameColumns in the order of paths. Small files are decoded
+    whole and large ones are split into chunks."""
+    with ProcessPoolExecutor(workers) as pool:
+        pending = [[pool.submit(_decode_chunk, task)
+                    for task in _tasks(path, chunk_size, frame_types)]
+                   for path in paths]
+        return [_merge([future.result() for future in futures])
+                for futures in pending]
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Profiling hooks for the frame processing loop.
+
+Hooks installed with AquaLogic.set_profiling_hooks() are called at four
+points for each frame: before the decoder is asked for it, once it has
+been decoded, once its handler has run, and once the data changed
+callbacks, change events and confirmations it triggered are done. With
+no hooks installed the loop only checks for them once per read."""
+
+import time
+
+from .core import FRAME_TYPE_NAMES
+
+STAGES = ('decode', 'dispatch', 'callbacks')
+
+
+class ProfilingHooks():
+    """Base class for profiling hooks; every hook does nothing."""
+
+    def frame_start(self):
+        """Called before decoding the next frame of a read."""
+
+    def frame_decoded(self, frame_type):
+        """Called when a frame has been decoded."""
+
+    def frame_dispatched(self, frame_type):
+        """Called when the frame's handler has returned."""
+
+    def callbacks_done(self, frame_type):
+        """Called when the callbacks for the frame have returned."""
+
+
+class StageSampler(ProfilingHooks):
+    """Aggregates the time spent in each stage by frame type.
+
+    Decode time runs from frame_start() to frame_decoded() and so
+    includes reading bytes from the decoder's buffer, unstuffing and the
+    checksum; dispatch covers the handler, including LCD decoding and
+    display parsing; callbacks covers everything run after it. Only
+    every sample_every'th frame is timed."""
+
+    def __init__(self, sample_every=1, clock=time.perf_counter):
+        self._sample_every = sample_every
+        self._clock = clock
+        self._countdown = 1
+        self._sampling = False
+        self._last = None
+        self._totals = {}   # (stage, frame_type) -> [count, total, max]
+
+    def frame_start(self):
+        # The countdown only moves on once a frame is decoded, as the
+        # last call of each read finds no frame.
+        self._sampling = self._countdown == 1
+        self._last = self._clock() if self._sampling else None
+
+    def _record(self, stage, frame_type):
+        if not self._sampling:
+            return
+        now = self._clock()
+        elapsed = now - self._last
+        self._last = now
+        totals = self._totals.get((stage, frame_type))
+        if totals is None:
+            self._totals[(stage, frame_type)] = [1, elapsed, elapsed]
+        else:
+            totals[0] += 1
+            totals[1] += elapsed
+            if elapsed > totals[2]:
+                totals[2] = elapsed
+
+    def frame_decoded(self, frame_type):
+        if self._sampling:
+            self._countdown = self._sample_every
+            self._record('decode', frame_type)
+        else:
+            self._countdown -= 1
+
+    def frame_dispatched(self, frame_type):
+        self._record('dispatch', frame_type)
+
+    def callbacks_done(self, frame_type):
+        self._record('callbacks', frame_type)
+
+    def reset(self):
+        """Discards the timings collected so far."""
+        self._totals = {}
+
+    def stats(self):
+        """Returns {stage: {frame type name: {'count', 'total', 'mean',
+        'max'}}} with times in seconds."""
+        result = {stage: {} for stage in STAGES}
+        for (stage, frame_type), (count, total, maximum) in \
+                self._totals.items():
+            name = FRAME_TYPE_NAMES.get(frame_type, frame_type.hex())
+            result[stage][name] = {'count': count, 'total': total,
+                                   'mean': total / count, 'max': maximum}
+        return result
+
+    def report(self):
+        """Returns the timings as a table, most total time first."""
+        rows = [(values['total'], stage, name, values)
+                for stage, names in self.stats().items()
+                for name, values in names.items()]
+        rows.sort(key=lambda row: row[0], reverse=True)
+        lines = ['{:10s} {:24s} {:>8s} {:>10s} {:>10s} {:>10s}'.format(
+            'stage', 'frame type', 'count', 'total ms', 'mean us',
+            'max us')]
+        for total, stage, name, values in rows:
+            lines.append('{:10s} {:24s} {:8d} {:10.3f} {:10.2f} {:10.2f}'
+                         .format(stage, name, values['count'], total * 1e3,
+                                 values['mean'] * 1e6, values['max'] * 1e6))
+        return '\n'.join(lines)
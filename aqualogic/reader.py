@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Buffered readers for the AquaLogic bus.
+
+Each reader pulls as many bytes as are available from its transport into
+a reusable buffer and hands them out from memory, so reading a frame
+costs a handful of system calls rather than one per byte."""
+
+import serial
+
+
+class BufferedReader():
+    """Base class for the buffered transport readers."""
+
+    BUFFER_SIZE = 4096
+
+    def __init__(self, size=BUFFER_SIZE):
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._pos = 0
+        self._end = 0
+
+    def _fill(self):
+        """Reads into self._view; returns the number of bytes read.
+        Raises the transport's timeout or EOF exception on no data."""
+        raise NotImplementedError
+
+    def _refill(self):
+        self._end = self._fill()
+        self._pos = 0
+
+    def read(self):
+        """Returns all buffered bytes, reading from the transport
+        if the buffer is empty."""
+        if self._pos >= self._end:
+            self._refill()
+        data = bytes(self._view[self._pos:self._end])
+        self._pos = self._end
+        return data
+
+
+class SocketReader(BufferedReader):
+    """Reads from a socket with recv_into; socket.timeout propagates."""
+
+    def __init__(self, sock, size=BufferedReader.BUFFER_SIZE):
+        super().__init__(size)
+        self._socket = sock
+
+    def _fill(self):
+        count = self._socket.recv_into(self._view)
+        if count == 0:
+            # Peer closed the connection
+            raise EOFError()
+        return count
+
+
+class SerialReader(BufferedReader):
+    """Reads everything waiting on a serial port, blocking for at
+    least one byte; raises SerialTimeoutException on timeout."""
+
+    def __init__(self, port, size=BufferedReader.BUFFER_SIZE):
+        super().__init__(size)
+        self._serial = port
+
+    def _fill(self):
+        count = min(max(self._serial.in_waiting, 1), len(self._buffer))
+        data = self._serial.read(count)
+        if len(data) == 0:
+            raise serial.SerialTimeoutException()
+        count = len(data)
+        self._buffer[:count] = data
+        return count
+
+
+class IOReader(BufferedReader):
+    """Reads from a file-like object; raises EOFError at end of file."""
+
+    def __init__(self, io, size=BufferedReader.BUFFER_SIZE):
+        super().__init__(size)
+        self._io = io
+
+    def _fill(self):
+        count = self._io.readinto(self._view)
+        if not count:
+            raise EOFError()
+        return count
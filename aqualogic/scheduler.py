@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""Transmit scheduling for frames waiting to be sent on the bus."""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class SendScheduler():
+    """Thread-safe priority queue of send requests.
+
+    Requests are the dicts AquaLogic queues ('frame', and for state
+    changes 'desired_states' and 'retries'). They are sent in priority
+    order, oldest first within a priority. A state change that undoes a
+    pending one for the same key cancels it, a duplicate is merged into
+    the pending request, and requests past their deadline are dropped
+    instead of being sent.
+
+    A state change handed out by get() stays in flight until finished()
+    is called once the LEDs confirm it or it fails. An index of the
+    states the requests in flight and waiting will change is rebuilt
+    whenever they change, so pending_state() is a dict lookup that never
+    takes the lock."""
+
+    def __init__(self, dropped_callback=None):
+        """dropped_callback is called with each request dropped because
+        its deadline passed or it was cancelled out."""
+        self._dropped_callback = dropped_callback
+        self._lock = threading.Lock()
+        self._heap = []
+        self._in_flight = []
+        self._pending_states = {}
+        self._counter = itertools.count()
+        self._sent = 0
+        self._merged = 0
+        self._cancelled = 0
+        self._expired = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = None
+
+    def put(self, data, priority=PRIORITY_NORMAL, deadline=None):
+        """Queues a request; deadline is a time.monotonic() value after
+        which the request is dropped. Returns the request that will be
+        sent, which is the pending one if data was merged into it, or
+        None if data cancelled out a pending request."""
+        now = time.monotonic()
+        cancelled = None
+        with self._lock:
+            self._land(data)
+            pending = self._find_counterpart(data)
+            if pending is not None:
+                if self._same_change(pending, data):
+                    self._merged += 1
+                    if priority < pending['priority']:
+                        pending['priority'] = priority
+                        self._reorder()
+                    self._update_index()
+                    if pending['deadline'] is not None:
+                        pending['deadline'] = (None if deadline is None else
+                                               max(deadline,
+                                                   pending['deadline']))
+                    return pending
+                # Two presses of the same key undo each other
+                self._cancelled += 2
+                self._heap = [item for item in self._heap
+                              if item[2] is not pending]
+                heapq.heapify(self._heap)
+                self._update_index()
+                cancelled = pending
+            else:
+                data['priority'] = priority
+                data['deadline'] = deadline
+                data['queued'] = now
+                heapq.heappush(self._heap,
+                               (priority, next(self._counter), data))
+                self._update_index()
+                return data
+        _LOGGER.info('Request cancelled out a pending request')
+        if self._dropped_callback is not None:
+            self._dropped_callback(cancelled)
+        return None
+
+    def get(self):
+        """Returns the next request to send, or None if there is none."""
+        now = time.monotonic()
+        expired = []
+        result = None
+        with self._lock:
+            while self._heap:
+                _, _, data = heapq.heappop(self._heap)
+                if data['deadline'] is not None and now > data['deadline']:
+                    self._expired += 1
+                    expired.append(data)
+                    continue
+                wait = now - data['queued']
+                self._sent += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                self._wait_last = wait
+                if data.get('desired_states'):
+                    self._in_flight.append(data)
+                result = data
+                break
+            if result is not None or expired:
+                self._update_index()
+        for data in expired:
+            _LOGGER.info('Dropping expired request')
+            if self._dropped_callback is not None:
+                self._dropped_callback(data)
+        return result
+
+    def finished(self, data):
+        """Stops counting a state change handed out by get() as in
+        flight, once it has been confirmed or has failed."""
+        with self._lock:
+            if self._land(data):
+                self._update_index()
+
+    def empty(self):
+        """Returns True if no requests are waiting."""
+        return not self._heap
+
+    def qsize(self):
+        """Returns the number of requests waiting."""
+        return len(self._heap)
+
+    def pending(self):
+        """Returns a list of the waiting requests in send order."""
+        with self._lock:
+            return [item[2] for item in sorted(self._heap)]
+
+    def pending_state(self, state):
+        """Returns the value a request in flight or waiting will change
+        state to, or None if none changes it."""
+        return self._pending_states.get(state)
+
+    def stats(self):
+        """Returns a dict of queue depth, wait times and counters."""
+        now = time.monotonic()
+        with self._lock:
+            oldest = min((item[2]['queued'] for item in self._heap),
+                         default=None)
+            return {
+                'depth': len(self._heap),
+                'oldest_wait': None if oldest is None else now - oldest,
+                'sent': self._sent,
+                'merged': self._merged,
+                'cancelled': self._cancelled,
+                'expired': self._expired,
+                'wait_last': self._wait_last,
+                'wait_max': self._wait_max,
+                'wait_mean': (self._wait_total / self._sent
+                              if self._sent else None),
+            }
+
+    def _find_counterpart(self, data):
+        """Returns a pending state change pressing the same key for the
+        same states as data, or None."""
+        desired_states = data.get('desired_states')
+        if not desired_states:
+            return None
+        states = {desired['state'] for desired in desired_states}
+        for _, _, pending in self._heap:
+            if (pending['frame'] == data['frame'] and
+                    pending.get('desired_states') and
+                    {desired['state'] for desired
+                     in pending['desired_states']} == states):
+                return pending
+        return None
+
+    @staticmethod
+    def _same_change(pending, data):
+        enabled = {desired['state']: desired['enabled']
+                   for desired in pending['desired_states']}
+        return all(enabled[desired['state']] == desired['enabled']
+                   for desired in data['desired_states'])
+
+    def _land(self, data):
+        # Called with the lock held; returns True if data was in flight.
+        for index, in_flight in enumerate(self._in_flight):
+            if in_flight is data:
+                del self._in_flight[index]
+                return True
+        return False
+
+    def _update_index(self):
+        # Called with the lock held. A new dict is built and swapped in
+        # so that readers never see it part way through an update; the
+        # request sent last determines the final value.
+        pending_states = {}
+        for data in self._in_flight + [item[2] for item
+                                       in sorted(self._heap)]:
+            for desired in data.get('desired_states') or ():
+                pending_states[desired['state']] = desired['enabled']
+        self._pending_states = pending_states
+
+    def _reorder(self):
+        self._heap = [(item[2]['priority'], item[1], item[2])
+                      for item in self._heap]
+        heapq.heapify(self._heap)
+
+
+class ConfirmationTracker():
+    """Tracks sent state changes until the panel's LEDs confirm them.
+
+    Sent requests are kept in a heap ordered by the time by which they
+    must be confirmed. It is only used by the thread processing frames,
+    so it takes no locks."""
+
+    CONFIRM_TIMEOUT = 2.0
+
+    def __init__(self, confirm_timeout=CONFIRM_TIMEOUT):
+        self._confirm_timeout = confirm_timeout
+        self._heap = []
+        self._counter = itertools.count()
+        self._confirmed = 0
+        self._timed_out = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._latency_last = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, data, now, led_frames=0):
+        """Starts tracking a request sent at now, when led_frames LED
+        frames had been received."""
+        data['sent_at'] = now
+        data['sent_led_frames'] = led_frames
+        heapq.heappush(self._heap, (now + self._confirm_timeout,
+                                    next(self._counter), data))
+
+    def confirm(self, get_state, now, led_frames=None):
+        """Returns the requests whose desired states all match
+        get_state(state), and stops tracking them. Given the number of
+        LED frames received, only requests sent before the last of them
+        are checked, so LEDs from before the press never confirm it."""
+        confirmed = []
+        remaining = []
+        for item in self._heap:
+            data = item[2]
+            if ((led_frames is None or
+                 led_frames > data['sent_led_frames']) and
+                    all(get_state(desired['state']) == desired['enabled']
+                        for desired in data['desired_states'])):
+                latency = now - data['sent_at']
+                self._confirmed += 1
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+                self._latency_last = latency
+                confirmed.append(data)
+            else:
+                remaining.append(item)
+        if confirmed:
+            heapq.heapify(remaining)
+            self._heap = remaining
+        return confirmed
+
+    def expire(self, now):
+        """Returns the requests whose confirmation deadline has passed,
+        and stops tracking them."""
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            expired.append(heapq.heappop(self._heap)[2])
+        self._timed_out += len(expired)
+        return expired
+
+    def stats(self):
+        """Returns a dict of confirmation counts and command to
+        confirmation latencies."""
+        return {
+            'in_flight': len(self._heap),
+            'confirmed': self._confirmed,
+            'timed_out': self._timed_out,
+            'latency_last': self._latency_last,
+            'latency_max': self._latency_max,
+            'latency_mean': (self._latency_total / self._confirmed
+                             if self._confirmed else None),
+        }
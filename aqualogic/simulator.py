@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Simulated AquaLogic panels for load and latency testing.
+
+A SimulatedPanel sends the frames a real panel puts on the bus:
+keep-alives, LEDs, a rotating set of display screens and pump status.
+Key events sent back to it toggle the matching States after a delay.
+Clients connect to it over TCP, as to a RS-485 to Ethernet adapter, or
+over a pseudo-terminal as to a serial port.
+
+Usage: python -m aqualogic.simulator [--panels N] [--port PORT]"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tty
+
+from .codec import encode_frame
+from .core import AquaLogic
+from .decoder import FrameDecoder
+from .keys import Keys
+from .states import States
+
+_LOGGER = logging.getLogger(__name__)
+
+KEEP_ALIVE_INTERVAL = 0.1
+
+# Frames sent on each keep-alive tick, in turn
+_TICK_LEDS, _TICK_DISPLAY, _TICK_PUMP = range(3)
+
+_WIRED_KEY_EVENTS = (AquaLogic.FRAME_TYPE_LOCAL_WIRED_KEY_EVENT,
+                     AquaLogic.FRAME_TYPE_REMOTE_WIRED_KEY_EVENT)
+
+_LCD_ENCODING = str.maketrans({'°': '\xdf'})
+
+
+def display_frame(top, bottom=''):
+    """Returns a display update frame showing the two lines of text."""
+    text = '{:<16.16}{:<16.16}'.format(top, bottom).translate(_LCD_ENCODING)
+    return encode_frame(AquaLogic.FRAME_TYPE_DISPLAY_UPDATE +
+                        text.encode('latin-1') + b'\x00')
+
+
+def leds_frame(states, flashing_states=0):
+    """Returns a LEDs frame for the given States bitmasks."""
+    return encode_frame(AquaLogic.FRAME_TYPE_LEDS +
+                        states.to_bytes(4, byteorder='little') +
+                        flashing_states.to_bytes(4, byteorder='little'))
+
+
+def pump_status_frame(speed, power):
+    """Returns a pump status frame; power is in watts."""
+    power = '{:04d}'.format(power)
+    bcd = bytes([int(power[0]) << 4 | int(power[1]),
+                 int(power[2]) << 4 | int(power[3])])
+    return encode_frame(AquaLogic.FRAME_TYPE_PUMP_STATUS + b'\x00\x00' +
+                        bytes([speed]) + bcd)
+
+
+class SimulatedPanel():
+    """A simulated panel serving any number of TCP and pty clients.
+
+    All clients share the panel's bus: each sees every frame and can
+    send key events."""
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, states=States.POOL | States.FILTER, key_delay=0.1,
+                 interval=KEEP_ALIVE_INTERVAL):
+        """key_delay is how long after a key event its States change;
+        interval is the time between keep-alives."""
+        self.states = int(states)
+        self.flashing_states = 0
+        self.pool_temp = 80
+        self.air_temp = 70
+        self.salt_level = 3100
+        self.pool_chlorinator = 50
+        self.pump_speed = 75
+        self.pump_power = 1250
+        self.key_delay = key_delay
+        self.interval = interval
+        self.keys_received = 0
+        self._loop = None
+        self._writers = []
+        self._servers = []
+        self._ptys = []
+        self._task = None
+        self._screen = 0
+        self._tick = 0
+
+    def screens(self):
+        """Returns the (top, bottom) lines of the screens the display
+        rotates through."""
+        return [
+            ('Pool Temp {}°F'.format(self.pool_temp), ''),
+            ('Air Temp {}°F'.format(self.air_temp), ''),
+            ('Salt Level', '{} PPM'.format(self.salt_level)),
+            ('Pool Chlorinator', '{}%'.format(self.pool_chlorinator)),
+            ('Heater1', 'Auto Control'),
+        ]
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        """Listens for TCP clients; returns the port listened on."""
+        self._start()
+        server = await asyncio.start_server(self._client, host, port)
+        self._servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    def start_pty(self):
+        """Creates a pseudo-terminal for a serial client; returns the
+        name of the port to open."""
+        self._start()
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        os.set_blocking(master, False)
+        decoder = FrameDecoder()
+        self._ptys.append((master, slave))
+        self._loop.add_reader(master, self._pty_readable, master, decoder)
+        return os.ttyname(slave)
+
+    async def close(self):
+        """Stops the panel and disconnects its clients."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        for writer in self._writers:
+            writer.close()
+        self._writers = []
+        for master, slave in self._ptys:
+            self._loop.remove_reader(master)
+            os.close(master)
+            os.close(slave)
+        self._ptys = []
+
+    def _start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._task = self._loop.create_task(self._run())
+
+    async def _run(self):
+        keep_alive = encode_frame(AquaLogic.FRAME_TYPE_KEEP_ALIVE)
+        while True:
+            self._send(keep_alive + self._next_frame())
+            await asyncio.sleep(self.interval)
+
+    def _next_frame(self):
+        tick = self._tick
+        self._tick = (tick + 1) % 3
+        if tick == _TICK_LEDS:
+            return leds_frame(self.states, self.flashing_states)
+        if tick == _TICK_DISPLAY:
+            screens = self.screens()
+            self._screen = (self._screen + 1) % len(screens)
+            return display_frame(*screens[self._screen])
+        return pump_status_frame(self.pump_speed, self.pump_power)
+
+    def _send(self, data):
+        for writer in self._writers:
+            writer.write(data)
+        for master, _ in self._ptys:
+            try:
+                os.write(master, data)
+            except BlockingIOError:
+                # Nobody is reading the port; drop the data as the bus would
+                pass
+
+    async def _client(self, reader, writer):
+        self._writers.append(writer)
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                self._received(decoder, data)
+        except ConnectionError:
+            pass
+        finally:
+            if writer in self._writers:
+                self._writers.remove(writer)
+                writer.close()
+
+    def _pty_readable(self, master, decoder):
+        try:
+            data = os.read(master, 4096)
+        except (BlockingIOError, OSError):
+            return
+        self._received(decoder, data)
+
+    def _received(self, decoder, data):
+        for frame in decoder.feed(data):
+            key = self._key(frame)
+            if key is not None:
+                self.keys_received += 1
+                self._loop.call_later(self.key_delay, self.press, key)
+
+    @staticmethod
+    def _key(frame):
+        """Returns the Keys value of a key event frame, or None."""
+        if frame.frame_type in _WIRED_KEY_EVENTS:
+            return int.from_bytes(frame.payload[0:2], byteorder='little')
+        if frame.frame_type == AquaLogic.FRAME_TYPE_WIRELESS_KEY_EVENT:
+            return int.from_bytes(frame.payload[1:5], byteorder='little')
+        return None
+
+    def press(self, key):
+        """Applies a key press to the panel's states."""
+        try:
+            key = Keys(key)
+        except ValueError:
+            _LOGGER.debug('Unknown key %x', key)
+            return
+        if key == Keys.POOL_SPA:
+            self.states ^= States.POOL | States.SPA
+        elif key.name in States.__members__:
+            self.states ^= States[key.name]
+        else:
+            _LOGGER.debug('Key %s changes no state', key.name)
+
+
+async def run_panels(count, host='127.0.0.1', port=0, **kwargs):
+    """Starts count panels on consecutive ports from port (or on any
+    free ports if port is 0); returns a list of (panel, port)."""
+    panels = []
+    for index in range(count):
+        panel = SimulatedPanel(**kwargs)
+        panels.append((panel, await panel.start_tcp(
+            host, port + index if port else 0)))
+    return panels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Simulated AquaLogic panels.')
+    parser.add_argument('--panels', type=int, default=1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0,
+                        help='first port to listen on (default: any)')
+    parser.add_argument('--pty', action='store_true',
+                        help='also create a serial port for each panel')
+    parser.add_argument('--key-delay', type=float, default=0.1)
+    parser.add_argument('--interval', type=float,
+                        default=KEEP_ALIVE_INTERVAL)
+    args = parser.parse_args(argv)
+
+    async def serve():
+        panels = await run_panels(args.panels, args.host, args.port,
+                                  key_delay=args.key_delay,
+                                  interval=args.interval)
+        for panel, port in panels:
+            line = '{}:{}'.format(args.host, port)
+            if args.pty:
+                line += ' ' + panel.start_pty()
+            print(line, flush=True)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Immutable snapshots of an AquaLogic panel's state."""
+
+from collections import namedtuple
+from functools import lru_cache
+
+from .states import States
+
+_FIELDS = [
+    'is_metric',
+    'air_temp',
+    'pool_temp',
+    'spa_temp',
+    'pool_chlorinator',
+    'spa_chlorinator',
+    'salt_level',
+    'check_system_msg',
+    'pump_speed',
+    'pump_power',
+    'states',
+    'flashing_states',
+    'multi_speed_pump',
+    'heater_auto_mode',
+    'super_chlor_time_remain',
+    'display',
+    'configmenu',
+    'stale_fields', # Fields restored from a state cache not yet reported
+    'timestamp',    # time.time() when the snapshot was published
+    'monotonic',    # time.monotonic() when the snapshot was published
+]
+
+_STATE_BY_BIT = {state.value: state for state in States}
+
+
+@lru_cache(maxsize=256)
+def enabled_states(states, flashing_states):
+    """Returns a tuple of the States enabled in an LED bitmask, plus
+    FILTER_LOW_SPEED if the FILTER LED is flashing."""
+    result = []
+    mask = states
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        state = _STATE_BY_BIT.get(bit)
+        if state is not None:
+            result.append(state)
+    if (flashing_states & States.FILTER) != 0:
+        result.append(States.FILTER_LOW_SPEED)
+    return tuple(result)
+
+
+class PanelSnapshot(namedtuple('PanelSnapshot', _FIELDS)):
+    """A consistent view of a panel's state.
+
+    The reader publishes a new snapshot by replacing a single reference,
+    so a snapshot can be read from any thread without locking and never
+    mixes values from before and after a frame."""
+
+    __slots__ = ()
+
+    @classmethod
+    def initial(cls):
+        """Returns the snapshot of a panel nothing has been received from."""
+        return cls(is_metric=False, air_temp=None, pool_temp=None,
+                   spa_temp=None, pool_chlorinator=None,
+                   spa_chlorinator=None, salt_level=None,
+                   check_system_msg=None, pump_speed=None, pump_power=None,
+                   states=0, flashing_states=0, multi_speed_pump=False,
+                   # Assume the heater is in auto mode
+                   heater_auto_mode=True,
+                   super_chlor_time_remain='00:00', display=None,
+                   configmenu=False, stale_fields=frozenset(),
+                   timestamp=None, monotonic=None)
+
+    def get_state(self, state):
+        """Returns True if the LEDs show state enabled."""
+        if state == States.FILTER_LOW_SPEED:
+            return (States.FILTER.value & self.flashing_states) != 0
+        return (state.value & self.states) != 0
+
+    def enabled_states(self):
+        """Returns a tuple of the enabled states."""
+        return enabled_states(self.states, self.flashing_states)
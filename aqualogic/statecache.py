@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""On-disk cache of a panel's last known state, for warm starts.
+
+The cache is a small JSON document holding the values of CACHED_FIELDS,
+each with the time.time() it was last reported by the panel, along with
+the time the snapshot they came from was published and the time the
+cache was saved. It is written to a temporary file in the same directory
+and renamed over the old one, so a crash mid-write leaves the previous
+cache intact."""
+
+import json
+import logging
+import os
+import tempfile
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+VERSION = 2
+
+# PanelSnapshot fields kept in the cache. The display is left out as it
+# only shows whatever screen was up when the cache was saved.
+CACHED_FIELDS = (
+    'is_metric',
+    'air_temp',
+    'pool_temp',
+    'spa_temp',
+    'pool_chlorinator',
+    'spa_chlorinator',
+    'salt_level',
+    'check_system_msg',
+    'pump_speed',
+    'pump_power',
+    'states',
+    'flashing_states',
+    'multi_speed_pump',
+    'heater_auto_mode',
+    'super_chlor_time_remain',
+    'configmenu',
+)
+
+
+def save_state(path, snapshot, reported_at=None):
+    """Atomically writes the CACHED_FIELDS of a PanelSnapshot to path.
+    reported_at is a dict of the times fields were last reported, for
+    those not reported as of the snapshot's timestamp."""
+    reported_at = reported_at or {}
+    document = {
+        'version': VERSION,
+        'saved_at': time.time(),
+        'timestamp': snapshot.timestamp,
+        'fields': {name: [getattr(snapshot, name),
+                          reported_at.get(name, snapshot.timestamp)]
+                   for name in CACHED_FIELDS},
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.statecache-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(document, file, separators=(',', ':'))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def load_state(path, max_age=None):
+    """Returns (timestamp, fields) from the cache at path, where fields is
+    a dict of the cached PanelSnapshot values and the times they were
+    last reported, leaving out those reported more than max_age seconds
+    ago. Returns None if there is no usable cache or no field is left."""
+    try:
+        with open(path) as file:
+            document = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as error:
+        _LOGGER.warning('Ignoring state cache %s: %s', path, error)
+        return None
+    try:
+        if document['version'] != VERSION:
+            raise ValueError('unknown version')
+        timestamp = document['timestamp']
+        cached = document['fields']
+        fields = {}
+        for name in CACHED_FIELDS:
+            if name in cached:
+                value, reported_at = cached[name]
+                fields[name] = (value, float(reported_at))
+    except (KeyError, TypeError, ValueError) as error:
+        _LOGGER.warning('Ignoring state cache %s: %s', path, error)
+        return None
+    if max_age is not None:
+        oldest = time.time() - max_age
+        fields = {name: field for name, field in fields.items()
+                  if field[1] >= oldest}
+    if not fields:
+        _LOGGER.info('Ignoring state cache %s: too old', path)
+        return None
+    return timestamp, fields
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Measures batch decoding throughput of a large synthetic capture file
+with aqualogic.batch.decode_capture(), and split across processes with
+aqualogic.parallel.decode_capture_parallel().
+
+Usage: python benchmarks/bench_batch.py"""
+
+import os
+import tempfile
+
+import common
+from aqualogic.batch import decode_capture
+from aqualogic.parallel import decode_capture_parallel
+
+SYNTHETIC_SIZE = 16 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def measure(decode, path):
+    size = os.path.getsize(path)
+    rows = []
+    elapsed = common.best_time(lambda: rows.append(len(decode(path))),
+                               repeat=3)
+    return {
+        'bytes': size,
+        'frames': rows[-1],
+        'seconds': elapsed,
+        'frames_per_sec': rows[-1] / elapsed,
+        'bytes_per_sec': size / elapsed,
+    }
+
+
+def run(size=SYNTHETIC_SIZE):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'synthetic.bin')
+        with open(path, 'wb') as capture:
+            capture.write(common.synthetic_capture(size))
+        return {
+            'serial': measure(decode_capture, path),
+            'parallel': measure(lambda path: decode_capture_parallel(
+                path, chunk_size=CHUNK_SIZE), path),
+        }
+
+
+def main():
+    for name, result in run().items():
+        print('{:10s} {} frames {:10.0f} frames/s {:8.2f} MB/s'.format(
+            name, result['frames'], result['frames_per_sec'],
+            result['bytes_per_sec'] / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Times display parsing per frame on the display frames in
+tests/data/*.bin: LCD character conversion, parsing the text without
+the display cache, and decoding through the cache.
+
+Usage: python benchmarks/bench_display.py"""
+
+import common
+from aqualogic import display
+from aqualogic.core import AquaLogic
+
+NUMBER = 200
+
+
+def per_frame(func, payloads):
+    return common.best_time(lambda: [func(payload) for payload in payloads],
+                            number=NUMBER) / len(payloads)
+
+
+def run():
+    payloads = common.display_payloads()
+    aq = AquaLogic()
+    return {
+        'frames': len(payloads),
+        'convert_lcd_chars': per_frame(aq._convert_lcd_chars, payloads),
+        'parse_uncached': per_frame(
+            lambda payload: display.parse_display(
+                display.convert_to_string(payload)), payloads),
+        'decode_cached': per_frame(
+            lambda payload: display.decode_display(payload), payloads),
+    }
+
+
+def main():
+    results = run()
+    print('{} display frames'.format(results.pop('frames')))
+    for name, elapsed in results.items():
+        print('{:20s} {:8.3f} us/frame'.format(name, elapsed * 1e6))
+
+
+if __name__ == '__main__':
+    main()
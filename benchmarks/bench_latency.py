@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Measures set_state() to LED confirmation latency against a fake panel
+on a local socket.
+
+The fake panel sends a keep-alive and its LEDs every INTERVAL seconds,
+and toggles a state as soon as it receives the key for it, so the
+latency measured is the library's own plus up to two intervals of
+waiting for the panel.
+
+Usage: python benchmarks/bench_latency.py"""
+
+import select
+import socket
+import statistics
+import threading
+import time
+
+import common  # noqa: F401 (puts aqualogic on the path)
+from aqualogic.codec import encode_frame
+from aqualogic.core import AquaLogic
+from aqualogic.decoder import FrameDecoder
+from aqualogic.keys import Keys
+from aqualogic.states import States
+
+INTERVAL = 0.01
+REQUESTS = 50
+
+
+class FakePanel():
+    """Serves one client, answering key events with LED changes."""
+
+    def __init__(self, interval=INTERVAL):
+        self._interval = interval
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(1)
+        self.port = self._server.getsockname()[1]
+        self._states = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _leds(self):
+        return encode_frame(AquaLogic.FRAME_TYPE_LEDS +
+                            self._states.to_bytes(4, byteorder='little') +
+                            bytes(4))
+
+    def _key(self, frame):
+        if frame.frame_type != AquaLogic.FRAME_TYPE_LOCAL_WIRED_KEY_EVENT:
+            return
+        key = Keys(int.from_bytes(frame.payload[0:2], byteorder='little'))
+        self._states ^= States[key.name]
+
+    def _serve(self):
+        conn, _ = self._server.accept()
+        decoder = FrameDecoder()
+        keep_alive = encode_frame(AquaLogic.FRAME_TYPE_KEEP_ALIVE)
+        next_time = time.monotonic()
+        with conn:
+            while self._running:
+                conn.sendall(keep_alive + self._leds())
+                next_time += self._interval
+                while True:
+                    wait = next_time - time.monotonic()
+                    if wait <= 0:
+                        break
+                    readable, _, _ = select.select([conn], [], [], wait)
+                    if readable:
+                        data = conn.recv(4096)
+                        if not data:
+                            return
+                        for frame in decoder.feed(data):
+                            self._key(frame)
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self._server.close()
+
+
+def run(requests=REQUESTS, interval=INTERVAL):
+    panel = FakePanel(interval)
+    aq = AquaLogic()
+    aq.connect('127.0.0.1', panel.port)
+    reader = threading.Thread(target=aq.process, daemon=True)
+    reader.start()
+    while aq.snapshot.timestamp is None:
+        time.sleep(interval)
+
+    latencies = []
+    enable = True
+    for _ in range(requests):
+        start = time.monotonic()
+        future = aq.request_state(States.LIGHTS, enable)
+        assert future.result(timeout=5), 'state change not confirmed'
+        latencies.append(time.monotonic() - start)
+        enable = not enable
+
+    panel.close()
+    reader.join()
+    latencies.sort()
+    return {
+        'requests': requests,
+        'interval': interval,
+        'latency_min': latencies[0],
+        'latency_median': statistics.median(latencies),
+        'latency_p95': latencies[int(len(latencies) * 0.95) - 1],
+        'latency_max': latencies[-1],
+        'confirm_latency_mean': aq.confirmation_stats()['latency_mean'],
+    }
+
+
+def main():
+    results = run()
+    for name, value in results.items():
+        if name.startswith('latency') or name.startswith('confirm'):
+            print('{:22s} {:8.3f} ms'.format(name, value * 1e3))
+        else:
+            print('{:22s} {}'.format(name, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Compares LCD character conversion against the original byte loop
+on the display frames in tests/data/*.bin.
+
+Usage: python benchmarks/bench_lcd.py"""
+
+import common
+from aqualogic.display import convert_lcd_chars
+
+NUMBER = 200
+
+
+def reference_convert_lcd_chars(data):
+    """The original byte at a time implementation."""
+    text = ""
+
+    # Remove any other non-ASCII characters
+    for i in range(0, len(data) - 1):
+        if data[i] < 0x20:
+            continue
+        elif data[i] >= 0x20 and data[i] <= 0x7f:
+            text += chr(data[i])
+        elif data[i] > 0x7f:
+            # Convert known Hitachi-like LCD characters to UTF-8
+            if data[i] == 0xdf: # Degree symbol
+                text += "°"
+
+    return text.strip()
+
+
+def run():
+    payloads = common.display_payloads()
+    for payload in payloads:
+        assert convert_lcd_chars(payload) == \
+            reference_convert_lcd_chars(payload), payload
+    results = {'frames': len(payloads)}
+    for name, func in (('reference', reference_convert_lcd_chars),
+                       ('table', convert_lcd_chars)):
+        results[name] = common.best_time(
+            lambda: [func(payload) for payload in payloads],
+            number=NUMBER) / len(payloads)
+    return results
+
+
+def main():
+    results = run()
+    for name in ('reference', 'table'):
+        print('{:10s} {:8.3f} us/frame'.format(name, results[name] * 1e6))
+    print('{} display frames, speedup {:.1f}x'.format(
+        results['frames'], results['reference'] / results['table']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Measures decode throughput through AquaLogic.process() on the
+captures in tests/data/*.bin and on a large synthetic capture.
+
+Usage: python benchmarks/bench_process.py"""
+
+from io import BytesIO
+
+import common
+from aqualogic.core import AquaLogic
+
+SYNTHETIC_SIZE = 4 * 1024 * 1024
+
+
+def process(data):
+    aq = AquaLogic()
+    aq.connect_io(BytesIO(data))
+    aq.process()
+
+
+def measure(data, repeat=common.REPEAT):
+    """Returns throughput figures for processing data."""
+    elapsed = common.best_time(lambda: process(data), repeat=repeat)
+    count = len(common.frames(data))
+    return {
+        'bytes': len(data),
+        'frames': count,
+        'seconds': elapsed,
+        'frames_per_sec': count / elapsed,
+        'bytes_per_sec': len(data) / elapsed,
+    }
+
+
+def run():
+    results = {}
+    for name, data in common.capture_files().items():
+        # The captures are small; process them enough times to time
+        results[name] = measure(data * 20)
+    results['synthetic'] = measure(
+        common.synthetic_capture(SYNTHETIC_SIZE), repeat=3)
+    return results
+
+
+def main():
+    for name, result in run().items():
+        print('{:20s} {:10.0f} frames/s {:8.2f} MB/s'.format(
+            name, result['frames_per_sec'], result['bytes_per_sec'] / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Helpers shared by the benchmarks."""
+
+import glob
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from aqualogic.codec import encode_frame  # noqa: E402
+from aqualogic.core import AquaLogic  # noqa: E402
+from aqualogic.decoder import FrameDecoder  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data')
+
+REPEAT = 5
+
+
+def capture_files():
+    """Returns {name: data} for the raw captures in tests/data."""
+    captures = {}
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, '*.bin'))):
+        with open(path, 'rb') as capture:
+            captures[os.path.basename(path)] = capture.read()
+    return captures
+
+
+def frames(data):
+    """Returns the frames decoded from data."""
+    return list(FrameDecoder().feed(data))
+
+
+def display_payloads():
+    """Returns the payloads of all display frames in the captures."""
+    return [frame.payload
+            for data in capture_files().values()
+            for frame in frames(data)
+            if frame.frame_type == AquaLogic.FRAME_TYPE_DISPLAY_UPDATE]
+
+
+def synthetic_capture(size, seed=0):
+    """Returns at least size bytes of bus traffic made by shuffling the
+    frames in tests/data, so the mix of frame types and screens matches
+    a real panel's."""
+    pool = [encode_frame(frame.frame_type + frame.payload)
+            for data in capture_files().values() for frame in frames(data)]
+    rand = random.Random(seed)
+    chunks = []
+    total = 0
+    while total < size:
+        chunk = rand.choice(pool)
+        chunks.append(chunk)
+        total += len(chunk)
+    return b''.join(chunks)
+
+
+def best_time(func, number=1, repeat=REPEAT):
+    """Returns the best time of repeat runs of number calls to func,
+    per call."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Runs the benchmark suite and compares the results with a baseline.
+
+Usage: python benchmarks/run.py [--save] [--baseline FILE]
+                                [--tolerance FRACTION] [--output FILE]
+
+Results are written as JSON. With --save they become the new baseline;
+otherwise any figure more than tolerance worse than the baseline is
+reported and the exit status is 1."""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import common  # noqa: F401 (puts aqualogic on the path)
+import bench_batch
+import bench_display
+import bench_lcd
+import bench_latency
+import bench_process
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+BENCHMARKS = {
+    'process': bench_process.run,
+    'display': bench_display.run,
+    'lcd': bench_lcd.run,
+    'latency': bench_latency.run,
+    'batch': bench_batch.run,
+}
+
+# Figures that describe the workload rather than measure it
+_COUNTS = {'bytes', 'frames', 'requests', 'interval'}
+
+
+def _higher_is_better(name):
+    return name.endswith('_per_sec')
+
+
+def _flatten(results, prefix=''):
+    for name, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, prefix + name + '.')
+        elif name not in _COUNTS and isinstance(value, (int, float)):
+            yield prefix + name, value
+
+
+def compare(results, baseline, tolerance):
+    """Returns (name, baseline, result) for each figure in results that
+    is more than tolerance worse than in baseline."""
+    previous = dict(_flatten(baseline['results']))
+    regressions = []
+    for name, value in _flatten(results['results']):
+        base = previous.get(name)
+        if not base:
+            continue
+        if _higher_is_better(name):
+            worse = value < base * (1 - tolerance)
+        else:
+            worse = value > base * (1 + tolerance)
+        if worse:
+            regressions.append((name, base, value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the baseline')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--output', help='also write the results here')
+    parser.add_argument('benchmarks', nargs='*',
+                        help='benchmarks to run: {} (default: all)'.format(
+                            ', '.join(BENCHMARKS)))
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark {}'.format(name))
+
+    results = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': {},
+    }
+    for name in args.benchmarks or BENCHMARKS:
+        print('Running {}'.format(name))
+        results['results'][name] = BENCHMARKS[name]()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.save:
+        with open(args.baseline, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print('Saved baseline to {}'.format(args.baseline))
+        return 0
+    if not os.path.exists(args.baseline):
+        print('No baseline; run with --save to create one')
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare(results, baseline, args.tolerance)
+    for name, base, value in regressions:
+        print('REGRESSION {}: {:.6g} -> {:.6g}'.format(name, base, value))
+    if not regressions:
+        print('No regressions against {}'.format(args.baseline))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
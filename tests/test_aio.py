@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.aio import AsyncAquaLogic
+from aqualogic.core import States
+import asyncio
+
+KEEP_ALIVE = b'\x10\x02\x01\x01\x00\x14\x10\x03'
+
+
+def run_server(handler, client_main):
+    async def main():
+        server = await asyncio.start_server(handler, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await client_main(port)
+        finally:
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(main())
+
+
+class TestAsyncAquaLogic(object):
+    def test_process(self):
+        async def handler(reader, writer):
+            with open('tests/data/pool_on.bin', 'rb') as capture:
+                writer.write(capture.read())
+            await writer.drain()
+            writer.close()
+
+        async def client_main(port):
+            aq = AsyncAquaLogic()
+            await aq.connect('127.0.0.1', port)
+
+            async def collect():
+                return [snapshot async for snapshot in aq.events()]
+
+            collectors = [asyncio.ensure_future(collect()) for _ in range(2)]
+            await asyncio.sleep(0)
+            await aq.process()
+            changes = await asyncio.gather(*collectors)
+            await aq.close()
+            return aq, changes
+
+        aq, (changes, other) = run_server(handler, client_main)
+        assert aq.pool_temp == -7
+        assert aq.salt_level == 3.1
+        assert aq.get_state(States.POOL)
+        # Every listener sees each change as it was published
+        assert changes == other
+        assert all(first is not second
+                   for first, second in zip(changes, changes[1:]))
+        times = [snapshot.monotonic for snapshot in changes]
+        assert times == sorted(times) and times[0] < times[-1]
+        assert changes[-1] == aq.snapshot
+        assert changes[-1].pool_temp == -7
+
+    def test_send_after_keep_alive(self):
+        received = asyncio.Queue()
+
+        async def handler(reader, writer):
+            writer.write(KEEP_ALIVE)
+            await writer.drain()
+            await received.put(await reader.read(64))
+            writer.close()
+
+        async def client_main(port):
+            aq = AsyncAquaLogic()
+            await aq.connect('127.0.0.1', port, tx_retry_enabled=False)
+            task = asyncio.ensure_future(aq.process())
+            assert await aq.set_state(States.LIGHTS, True)
+            frame = await received.get()
+            await task
+            await aq.close()
+            return frame
+
+        frame = run_server(handler, client_main)
+        assert frame == b'\x10\x02\x00\x02\x00\x01\x00\x01\x00\x16\x10\x03'
+
+    def test_request_dropped(self):
+        async def handler(reader, writer):
+            await asyncio.sleep(0.05)
+            writer.write(KEEP_ALIVE)
+            await writer.drain()
+            writer.close()
+
+        async def client_main(port):
+            aq = AsyncAquaLogic()
+            await aq.connect('127.0.0.1', port)
+            task = asyncio.ensure_future(aq.process())
+            result = await asyncio.wait_for(
+                aq.request_state(States.LIGHTS, True, timeout=0), 1)
+            await task
+            await aq.close()
+            return result
+
+        assert run_server(handler, client_main) is False
+
+    def test_debounced_changes_delivered(self):
+        async def handler(reader, writer):
+            with open('tests/data/pool_on.bin', 'rb') as capture:
+                writer.write(capture.read())
+            await writer.drain()
+            writer.close()
+
+        async def client_main(port):
+            aq = AsyncAquaLogic()
+            events = []
+            aq.set_change_callback(events.append, debounce=3600)
+            await aq.connect('127.0.0.1', port)
+            await aq.process()
+            await aq.close()
+            return events
+
+        events = run_server(handler, client_main)
+        assert len(events) == 1
+        assert events[0].changes['pool_temp'] == (None, -7)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.batch import decode_buffer, decode_capture
+from aqualogic.core import AquaLogic, States
+from aqualogic.codec import encode_frame
+from aqualogic.simulator import display_frame, pump_status_frame
+from io import FileIO
+import glob
+import math
+import pytest
+
+
+def last(column):
+    values = [value for value in column
+              if value != -1 and not (isinstance(value, float) and
+                                      math.isnan(value))]
+    return values[-1] if values else None
+
+
+@pytest.mark.parametrize('path', sorted(glob.glob('tests/data/*.bin')))
+def test_matches_process(path):
+    aq = AquaLogic()
+    aq.connect_io(FileIO(path))
+    aq.process()
+    columns = decode_capture(path)
+    stats = aq.stats()
+    assert len(columns) == sum(stats['frames'].values())
+    assert columns.bad_crc == stats['bad_crc']
+    assert columns.resyncs == stats['resyncs']
+    assert columns.discarded == stats['discarded_bytes']
+    for name in ('air_temp', 'pool_temp', 'spa_temp', 'salt_level'):
+        assert last(getattr(columns, name)) == getattr(aq, name)
+    assert (last(columns.states) ==
+            aq.snapshot.states & ~States.HEATER_AUTO_MODE)
+    assert list(columns.offset) == sorted(columns.offset)
+
+
+def test_columns():
+    data = (b'\x00' + display_frame('Pool Temp 80°F') +
+            pump_status_frame(75, 1250) +
+            display_frame('Salt Level', '3.1 g/L'))
+    columns = decode_buffer(data)
+    assert list(columns.offset) == [1, 1 + len(display_frame('Pool Temp')),
+                                    data.rindex(b'\x10\x02')]
+    assert list(columns.frame_type) == [0x0103, 0x000c, 0x0103]
+    assert columns.pool_temp[0] == 80
+    assert math.isnan(columns.pool_temp[1])
+    assert list(columns.pump_speed) == [-1, -1, -1]
+    assert list(columns.pump_power) == [-1, 1250, -1]
+    assert columns.salt_level[2] == 3.1
+    assert list(columns.is_metric) == [0, -1, 1]
+    assert columns.discarded == 1
+
+    only_pump = decode_buffer(data, frame_types=[
+        AquaLogic.FRAME_TYPE_PUMP_STATUS])
+    assert list(only_pump.pump_power) == [1250]
+
+    tail = decode_buffer(data, start=columns.offset[1] + 1)
+    assert list(tail.frame_type) == [0x0103]
+
+
+def test_pump_speed():
+    data = (encode_frame(AquaLogic.FRAME_TYPE_PUMP_SPEED_REQUEST +
+                         b'\x90\x00') +
+            pump_status_frame(75, 1250))
+    columns = decode_buffer(data)
+    assert list(columns.pump_speed) == [0x9000, -1]
+    aq = AquaLogic()
+    aq._process_data(data, lambda panel: None)
+    assert last(columns.pump_speed) == aq.pump_speed
+    assert last(columns.pump_power) == aq.pump_power
+
+
+def test_empty(tmp_path):
+    path = tmp_path / 'empty.bin'
+    path.write_bytes(b'')
+    assert len(decode_capture(str(path))) == 0
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.capture import (CaptureRecorder, ReplayReader, read_capture,
+                               MAGIC)
+from aqualogic.core import AquaLogic
+from io import BytesIO, FileIO
+import threading
+import time
+import pytest
+
+
+def record(path):
+    """Runs a raw dump through a panel with capture on; returns the
+    capture and the panel."""
+    aq = AquaLogic()
+    capture = BytesIO()
+    aq.connect_io(FileIO(path))
+    aq.start_capture(capture)
+    aq.process()
+    aq.stop_capture()
+    return capture.getvalue(), aq
+
+
+def test_round_trip():
+    capture, recorded = record('tests/data/pool_on.bin')
+    assert capture.startswith(MAGIC)
+    data = b''.join(chunk for _, chunk in read_capture(BytesIO(capture)))
+    assert data == open('tests/data/pool_on.bin', 'rb').read()
+
+    aq = AquaLogic()
+    aq.connect_replay(BytesIO(capture))
+    aq.process()
+    assert (aq.snapshot._replace(timestamp=None, monotonic=None) ==
+            recorded.snapshot._replace(timestamp=None, monotonic=None))
+
+
+def test_offsets():
+    capture, _ = record('tests/data/spa_on.bin')
+    offsets = [offset for offset, _ in read_capture(BytesIO(capture))]
+    assert offsets[0] == 0
+    assert offsets == sorted(offsets)
+
+
+def test_truncated():
+    capture, _ = record('tests/data/idle.bin')
+    chunks = list(read_capture(BytesIO(capture)))
+    assert list(read_capture(BytesIO(capture[:-1]))) == chunks[:-1]
+
+
+def test_stop_from_another_thread(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    recorder = CaptureRecorder(path)
+    recorder.write(b'a')
+    recorder.close()
+    # Chunks the reader writes after the capture was stopped are dropped
+    recorder.write(b'b')
+    assert [chunk for _, chunk in read_capture(path)] == [b'a']
+
+    aq = AquaLogic()
+    data = open('tests/data/pool_on.bin', 'rb').read()
+    done = threading.Event()
+
+    def toggle():
+        while not done.is_set():
+            aq.start_capture(str(tmp_path / 'toggled.bin'))
+            aq.stop_capture()
+
+    thread = threading.Thread(target=toggle)
+    thread.start()
+    try:
+        for _ in range(50):
+            for start in range(0, len(data), 64):
+                aq._process_data(data[start:start + 64], lambda panel: None)
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_not_a_capture():
+    with pytest.raises(ValueError):
+        list(read_capture(BytesIO(open('tests/data/idle.bin', 'rb').read())))
+
+
+def test_replay_speed(monkeypatch):
+    capture = BytesIO()
+    recorder = CaptureRecorder(capture)
+    times = iter([0, 1000000000, 3000000000])
+    monkeypatch.setattr(time, 'monotonic_ns', lambda: next(times))
+    for chunk in (b'a', b'b', b'c'):
+        recorder.write(chunk)
+    recorder.close()
+    monkeypatch.undo()
+
+    sleeps = []
+    monkeypatch.setattr(time, 'sleep', sleeps.append)
+    monkeypatch.setattr(time, 'monotonic', lambda: 100.0)
+    reader = ReplayReader(BytesIO(capture.getvalue()), speed=2.0)
+    assert [reader.read() for _ in range(3)] == [b'a', b'b', b'c']
+    assert sleeps == [0.5, 1.5]
+    with pytest.raises(EOFError):
+        reader.read()
+
+    sleeps.clear()
+    reader = ReplayReader(BytesIO(capture.getvalue()))
+    assert [reader.read() for _ in range(3)] == [b'a', b'b', b'c']
+    assert not sleeps
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic import codec
+from aqualogic.core import AquaLogic
+from aqualogic.decoder import FrameDecoder, Frame
+from aqualogic.keys import Keys
+import random
+import pytest
+
+
+def reference_encode_frame(data):
+    """Byte at a time framing, as AquaLogic originally built frames."""
+    def append_data(frame, data):
+        for byte in data:
+            frame.append(byte)
+            if byte == codec.FRAME_DLE:
+                frame.append(0)
+
+    frame = bytearray([codec.FRAME_DLE, codec.FRAME_STX])
+    append_data(frame, data)
+    crc = 0
+    for byte in frame:
+        crc += byte
+    append_data(frame, crc.to_bytes(2, byteorder='big'))
+    frame += bytes([codec.FRAME_DLE, codec.FRAME_ETX])
+    return bytes(frame)
+
+
+def random_payloads(count=500):
+    rand = random.Random(1234)
+    # Favour DLE, STX and ETX so stuffing is exercised
+    alphabet = [0x00, 0x02, 0x03, 0x10, 0x10, 0x10, 0xff] + list(range(256))
+    for _ in range(count):
+        length = rand.randint(2, 61)
+        yield bytes(rand.choice(alphabet) for _ in range(length))
+
+
+class TestCodec(object):
+    def test_encode_matches_reference(self):
+        for data in random_payloads():
+            assert codec.encode_frame(data) == reference_encode_frame(data)
+
+    def test_round_trip(self):
+        for data in random_payloads():
+            frame = codec.encode_frame(data)
+            assert frame[:2] == codec.FRAME_START
+            assert frame[-2:] == codec.FRAME_END
+            assert codec.unstuff(codec.stuff(data)) == data
+            assert codec.decode_frame(frame[2:-2]) == data
+
+    def test_decoder_round_trip(self):
+        payloads = list(random_payloads())
+        stream = b''.join(codec.encode_frame(data) for data in payloads)
+        frames = list(FrameDecoder().feed(stream))
+        assert frames == [Frame(data[:2], data[2:]) for data in payloads]
+
+    def test_bad_checksum(self):
+        frame = bytearray(codec.encode_frame(b'\x01\x01'))
+        frame[-3] ^= 0x01
+        assert codec.decode_frame(bytes(frame[2:-2])) is None
+
+    def test_unstuff_non_null(self):
+        # The byte after a DLE is dropped even if it isn't a NULL
+        assert codec.unstuff(b'\x01\x10\x10\x00\x02') == b'\x01\x10\x00\x02'
+
+    @pytest.mark.parametrize('key', list(Keys))
+    def test_key_event_frame(self, key):
+        if key.value > 0xffff:
+            data = (AquaLogic.FRAME_TYPE_WIRELESS_KEY_EVENT + b'\x01' +
+                    key.value.to_bytes(4, byteorder='little') * 2 + b'\x00')
+        else:
+            data = (AquaLogic.FRAME_TYPE_LOCAL_WIRED_KEY_EVENT +
+                    key.value.to_bytes(2, byteorder='little') * 2)
+        assert (AquaLogic()._get_key_event_frame(key) ==
+                reference_encode_frame(data))
+
+    def test_key_event_source(self):
+        aq = AquaLogic()
+        aq.set_key_event_source(AquaLogic.FRAME_TYPE_REMOTE_WIRED_KEY_EVENT)
+        assert aq._get_key_event_frame(Keys.LIGHTS) == reference_encode_frame(
+            AquaLogic.FRAME_TYPE_REMOTE_WIRED_KEY_EVENT + b'\x00\x01' * 2)
+        aq.set_key_event_source(AquaLogic.FRAME_TYPE_WIRELESS_KEY_EVENT)
+        assert aq._get_key_event_frame(Keys.LIGHTS) == reference_encode_frame(
+            AquaLogic.FRAME_TYPE_WIRELESS_KEY_EVENT + b'\x01' +
+            b'\x00\x01\x00\x00' * 2 + b'\x00')
+        with pytest.raises(ValueError):
+            aq.set_key_event_source(AquaLogic.FRAME_TYPE_LEDS)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from aqualogic.core import AquaLogic, States
+from aqualogic.codec import encode_frame
 from io import FileIO
 import pytest
 import logging
@@ -62,3 +63,104 @@ class TestAquaLogic(object):
         assert not aq.get_state(States.SPA)
 
 
+
+    def test_change_events(self):
+        legacy = []
+        events = []
+        aq = AquaLogic()
+        aq.set_change_callback(events.append)
+        aq.connect_io(FileIO('tests/data/pool_on.bin'))
+        aq.process(legacy.append)
+        assert 0 < len(events) < len(legacy)
+        for event in events:
+            assert event.panel is aq
+            for old, new in event.changes.values():
+                assert old != new
+        assert events[0].changes['states'][0] == 0
+        pool_temps = [event.changes['pool_temp'] for event in events
+                      if 'pool_temp' in event.changes]
+        assert pool_temps == [(None, -7)]
+
+    def test_change_events_debounced(self):
+        events = []
+        aq = AquaLogic()
+        aq.set_change_callback(events.append, debounce=3600)
+        aq.connect_io(FileIO('tests/data/pool_on.bin'))
+        aq.process()
+        # Everything is coalesced into one event when process() returns
+        assert len(events) == 1
+        changes = events[0].changes
+        assert changes['pool_temp'] == (None, -7)
+        assert changes['states'] == (0, aq.snapshot.states)
+
+    def test_snapshot(self):
+        snapshots = []
+        aq = AquaLogic()
+        aq.connect_io(FileIO('tests/data/pool_on.bin'))
+        aq.process(lambda panel: snapshots.append(panel.snapshot))
+        snapshot = aq.snapshot
+        assert snapshot.pool_temp == aq.pool_temp == -7
+        assert snapshot.is_metric
+        assert snapshot.timestamp is not None
+        assert snapshot.get_state(States.POOL)
+        assert list(snapshot.enabled_states()) == aq.states()
+        assert States.POOL in aq.states()
+        with pytest.raises(AttributeError):
+            snapshot.pool_temp = 0
+        # Earlier snapshots are left untouched
+        assert snapshots[0].pool_temp is None
+
+    def test_subscriptions(self):
+        lights = []
+        temps = []
+        everything = []
+        aq = AquaLogic()
+        aq.subscribe(lights.append, states=States.LIGHTS | States.AUX_1)
+        aq.subscribe(temps.append, fields=['pool_temp', 'air_temp'])
+        unsubscribed = aq.subscribe(everything.append)
+        aq.unsubscribe(unsubscribed)
+        aq.connect_io(FileIO('tests/data/lights_on_off.bin'))
+        aq.process()
+        # Initial state, then the lights going on and off
+        assert len(lights) >= 3
+        assert all((States.LIGHTS | States.AUX_1) &
+                   (event.changes['states'][0] ^ event.changes['states'][1])
+                   for event in lights)
+        assert temps
+        assert all({'pool_temp', 'air_temp'} & set(event.changes)
+                   for event in temps)
+        assert everything == []
+        with pytest.raises(ValueError):
+            aq.subscribe(temps.append, fields=['pool_temperature'])
+
+    def test_long_display_update(self):
+        aq = AquaLogic()
+        aq._process_data(encode_frame(
+            AquaLogic.FRAME_TYPE_LEDS + bytes(8)), self.data_changed)
+        assert aq.state_timing()['time_to_complete_state'] is None
+        assert aq.stats()['time_to_complete_state'] is None
+        aq._process_data(encode_frame(
+            AquaLogic.FRAME_TYPE_LONG_DISPLAY_UPDATE +
+            b'Air Temp   -6\xdfC\x00Pool Temp  -7\xdfC\x00'
+            b'    Heater1       Auto Control\x00'), self.data_changed)
+        assert aq.air_temp == -6
+        assert aq.pool_temp == -7
+        assert aq.is_metric
+        assert aq.display is None
+        timing = aq.state_timing()
+        assert timing['time_to_complete_state'] >= 0
+        assert set(timing['fields']) >= {'states', 'air_temp', 'pool_temp',
+                                         'heater_auto_mode'}
+        assert aq.stats()['time_to_complete_state'] == \
+            timing['time_to_complete_state']
+
+    def test_complete_state_fields(self):
+        aq = AquaLogic()
+        aq.set_complete_state_fields(['states', 'salt_level'])
+        aq.connect_io(FileIO('tests/data/pool_on.bin'))
+        aq.process()
+        timing = aq.state_timing()
+        assert timing['time_to_complete_state'] == timing['fields'][
+            'salt_level']
+        aq.set_complete_state_fields(['spa_temp'])
+        assert aq.state_timing()['time_to_complete_state'] is None
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.decoder import FrameDecoder, Frame
+import pytest
+
+KEEP_ALIVE = b'\x10\x02\x01\x01\x00\x14\x10\x03'
+
+
+class TestFrameDecoder(object):
+    def decode(self, data, chunk_size):
+        decoder = FrameDecoder()
+        frames = []
+        for i in range(0, len(data), chunk_size):
+            frames.extend(decoder.feed(data[i:i + chunk_size]))
+        return frames
+
+    def test_keep_alive(self):
+        frames = self.decode(KEEP_ALIVE, len(KEEP_ALIVE))
+        assert frames == [Frame(b'\x01\x01', b'')]
+
+    def test_leading_garbage(self):
+        frames = self.decode(b'\x00\x10\x10\x00' + KEEP_ALIVE, 3)
+        assert frames == [Frame(b'\x01\x01', b'')]
+
+    def test_bad_crc(self):
+        frames = self.decode(b'\x10\x02\x01\x01\x00\x15\x10\x03' +
+                             KEEP_ALIVE, 64)
+        assert frames == [Frame(b'\x01\x01', b'')]
+
+    def test_resync_on_start(self):
+        # A frame that is cut off by the start of the next one is dropped
+        frames = self.decode(b'\x10\x02\x01\x02\x05' + KEEP_ALIVE, 64)
+        assert frames == [Frame(b'\x01\x01', b'')]
+
+    @pytest.mark.parametrize('chunk_size', [1, 2, 7, 4096])
+    def test_chunking(self, chunk_size):
+        with open('tests/data/pool_on.bin', 'rb') as capture:
+            data = capture.read()
+        expected = self.decode(data, len(data))
+        assert len(expected) > 100
+        assert self.decode(data, chunk_size) == expected
+
+    def test_feed_without_reading(self):
+        decoder = FrameDecoder()
+        decoder.feed(KEEP_ALIVE[:5])
+        decoder.feed(KEEP_ALIVE[5:] + KEEP_ALIVE)
+        # Frames not read from earlier calls are returned by the next
+        assert list(decoder.feed(KEEP_ALIVE[:3])) == \
+            [Frame(b'\x01\x01', b'')] * 2
+        assert list(decoder.feed(KEEP_ALIVE[3:])) == \
+            [Frame(b'\x01\x01', b'')]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic import display
+from aqualogic.display import (parse_display, display_parser,
+                               remove_display_parser)
+from aqualogic.core import AquaLogic
+from aqualogic.simulator import display_frame
+import pytest
+
+
+class TestParseDisplay(object):
+    @pytest.mark.parametrize('text,values', [
+        ('Pool Temp 78°F', {'pool_temp': 78, 'is_metric': False}),
+        ('Air Temp\n-6°C', {'air_temp': -6, 'is_metric': True}),
+        ('Salt Level\n3.1 g/L', {'salt_level': 3.1, 'is_metric': True}),
+        ('Spa Chlorinator\n3%', {'spa_chlorinator': 3}),
+        ('Check System\nLow Salt', {'check_system_msg': 'Low Salt'}),
+        ('Chlorinator Off\nNo Flow', {'check_system_msg': 'No Flow'}),
+        ('Chlorinator Off\nService', {}),
+        ('Heater1\nManual Off', {'heater_auto_mode': False}),
+        ('Gas Heater\nAuto', {'heater_auto_mode': True}),
+        ('Pool Temp\n--', {}),
+        ('Salt Level', {}),
+        ('', {}),
+    ])
+    def test_parse(self, text, values):
+        assert parse_display(text) == values
+
+    def test_register(self):
+        @display_parser('Filter', 'Speed')
+        def _filter_speed(parts):
+            return {'pump_speed': int(parts[2][:-1])}
+
+        try:
+            assert parse_display('Filter Speed\n50%') == {'pump_speed': 50}
+        finally:
+            remove_display_parser('Filter', 'Speed')
+        assert parse_display('Filter Speed\n50%') == {}
+
+    def test_unknown_field(self, caplog):
+        @display_parser('Filter', 'Speed')
+        def _filter_speed(parts):
+            return {'filter_speed': 1, 'pump_speed': 50}
+
+        try:
+            assert parse_display('Filter Speed\n50%') == {'pump_speed': 50}
+            aq = AquaLogic()
+            aq._process_data(display_frame('Filter Speed', '50%'),
+                             lambda panel: None)
+            assert aq.pump_speed == 50
+        finally:
+            remove_display_parser('Filter', 'Speed')
+        assert 'filter_speed' in caplog.text
+
+
+class TestDecodeDisplay(object):
+    def test_cache(self):
+        display.set_display_cache_size(4)
+        payload = b'  Pool Temp   \x00   78\xdfF     \x00'
+        assert display.decode_display(payload) == (
+            'Pool Temp\n78°F', (('pool_temp', 78), ('is_metric', False)))
+        display.decode_display(payload)
+        info = display.display_cache_info()
+        assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+        display.set_display_cache_size(display.DISPLAY_CACHE_SIZE)
+
+    def test_long_display(self):
+        payload = (b'\x01Air Temp   70\xdfF\x00   Salt Level       3.1 g/L'
+                   b'\x00\x00    Heater1       Manual Off\x00')
+        texts, values = display.decode_long_display(payload)
+        assert texts == ('Air Temp   70°F', 'Salt Level       3.1 g/L',
+                         'Heater1       Manual Off')
+        assert dict(values) == {'air_temp': 70, 'salt_level': 3.1,
+                                'is_metric': True,
+                                'heater_auto_mode': False}
+
+
+class TestConvertLcdChars(object):
+    @pytest.mark.parametrize('data,text', [
+        (b' 78\xdfF \x00', '78°F'),
+        (b'\x01Pool\x7f\x00', 'Pool\x7f'),
+        (b'\xb1\xe4\xf4\x90\x00', 'ｱμΩ'),
+        (b'Temp\xdf', 'Temp'),
+        (b'', ''),
+    ])
+    def test_convert(self, data, text):
+        assert display.convert_lcd_chars(data) == text
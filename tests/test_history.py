@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.core import AquaLogic, States
+from aqualogic.history import HistoryRing
+from io import FileIO
+import random
+import pytest
+
+
+def test_ring():
+    ring = HistoryRing(4)
+    assert ring.last() is None
+    assert ring.min() is None
+    assert ring.last_change() is None
+    for timestamp, value in ((1, 10), (2, 20), (3, 20), (4, 5), (5, 7),
+                             (6, 7)):
+        ring.append(timestamp, value)
+    assert len(ring) == 4
+    assert ring.samples() == [(3, 20), (4, 5), (5, 7), (6, 7)]
+    assert ring.last() == (6, 7)
+    assert ring.last_change() == 5
+    assert ring.min() == 5
+    assert ring.max() == 20
+    # The value in effect at the start of the window counts
+    assert ring.samples(4.5, 5.5) == [(4, 5), (5, 7)]
+    assert ring.max(4.5) == 7
+    assert ring.min(5.5) == 7
+    # Each value holds until the next sample
+    assert ring.mean(4, 6) == pytest.approx(6)
+    assert ring.mean(3.5, 4.5) == pytest.approx(12.5)
+    # Before the oldest sample held nothing is known
+    assert ring.mean(0, 4) == pytest.approx(20)
+    assert ring.mean(0, 2) is None
+
+
+def test_ring_matches_brute_force():
+    rand = random.Random(0)
+    size = 50
+    ring = HistoryRing(size, 'q')
+    samples = []
+    timestamp = 0.0
+    for _ in range(500):
+        timestamp += rand.random()
+        value = rand.randrange(100)
+        ring.append(timestamp, value)
+        samples.append((timestamp, value))
+        held = samples[-size:]
+        start = rand.uniform(held[0][0], timestamp)
+        end = rand.uniform(start, timestamp + 1)
+        window = [sample for sample in held if start < sample[0] <= end]
+        before = [sample for sample in held if sample[0] <= start]
+        if before:
+            window.insert(0, before[-1])
+        assert ring.samples(start, end) == window
+        assert ring.min(start, end) == min(value for _, value in window)
+        assert ring.max(start, end) == max(value for _, value in window)
+
+
+def test_panel_history():
+    aq = AquaLogic()
+    aq.enable_history(size=16)
+    aq.connect_io(FileIO('tests/data/lights_on_off.bin'))
+    aq.process()
+    assert aq.history('states').last()[1] == aq.snapshot.states
+    lights = [value & States.LIGHTS for _, value
+              in aq.history('states').samples()]
+    assert 0 in lights and States.LIGHTS in lights
+    with pytest.raises(KeyError):
+        aq.history('display')
+    with pytest.raises(ValueError):
+        aq.enable_history(fields=['display'])
+
+    aq = AquaLogic()
+    aq.enable_history(fields=['pool_temp'])
+    aq.connect_io(FileIO('tests/data/pool_on.bin'))
+    aq.process()
+    assert aq.history('pool_temp').last()[1] == aq.pool_temp == -7
+
+    # Enabling history starts from the current values
+    aq.enable_history(fields=['air_temp'])
+    assert aq.history('air_temp').samples() == [
+        (aq.snapshot.timestamp, aq.air_temp)]
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.manager import PanelManager
+from aqualogic.core import States
+import socket
+
+
+def poll_until(manager, condition, polls=100):
+    for _ in range(polls):
+        if condition():
+            return True
+        manager.poll(0.05)
+    return condition()
+
+
+class TestPanelManager(object):
+    def test_serves_and_reconnects(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+        changed = set()
+
+        manager = PanelManager(lambda name, panel: changed.add(name))
+        panel = manager.add_socket('pool', '127.0.0.1', port)
+        assert poll_until(
+            manager, lambda: manager.health()['pool']['state'] == 'connected')
+
+        conn, _ = server.accept()
+        with open('tests/data/pool_on.bin', 'rb') as capture:
+            conn.sendall(capture.read())
+        conn.close()
+
+        assert poll_until(
+            manager,
+            lambda: manager.health()['pool']['state'] == 'disconnected')
+        health = manager.health()['pool']
+        assert health['frames'] > 100
+        assert health['reconnects'] == 1
+        assert health['retry_in'] > 0
+        assert changed == {'pool'}
+        assert panel.pool_temp == -7
+        assert panel.get_state(States.POOL)
+
+        manager.close()
+        server.close()
+
+    def test_connect_timeout(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(0)
+        port = server.getsockname()[1]
+        # Fill the accept queue so that further connection attempts hang
+        filler = socket.create_connection(('127.0.0.1', port))
+
+        manager = PanelManager()
+        manager.CONNECT_TIMEOUT = 0.2
+        manager.add_socket('pool', '127.0.0.1', port)
+        assert poll_until(
+            manager, lambda: manager.health()['pool']['reconnects'] > 0)
+        health = manager.health()['pool']
+        assert health['state'] == 'disconnected'
+        assert health['last_error'] == 'Connect timeout'
+        manager.close()
+        filler.close()
+        server.close()
+
+    def test_spurious_wakeup(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        manager = PanelManager()
+        manager.add_socket('pool', '127.0.0.1', server.getsockname()[1])
+        assert poll_until(
+            manager, lambda: manager.health()['pool']['state'] == 'connected')
+        # Nothing to read yet: the link stays up
+        manager._read(manager._links['pool'])
+        assert manager.health()['pool']['state'] == 'connected'
+        manager.close()
+        server.close()
+
+    def test_connect_refused(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        manager = PanelManager()
+        manager.add_socket('pool', '127.0.0.1', port)
+        assert poll_until(
+            manager, lambda: manager.health()['pool']['reconnects'] > 0)
+        assert manager.health()['pool']['state'] == 'disconnected'
+        manager.close()
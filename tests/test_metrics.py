@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.codec import encode_frame
+from aqualogic.core import AquaLogic, States
+from aqualogic.decoder import FrameDecoder
+from aqualogic.metrics import Histogram, MetricsServer, prometheus_text
+from aqualogic.simulator import leds_frame
+from urllib.request import urlopen
+from urllib.error import HTTPError
+import pytest
+import time
+
+KEEP_ALIVE = encode_frame(AquaLogic.FRAME_TYPE_KEEP_ALIVE)
+
+
+def test_histogram():
+    histogram = Histogram((1, 10))
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    stats = histogram.stats()
+    assert stats['count'] == 4
+    assert stats['sum'] == 56.5
+    assert stats['buckets'] == {1: 2, 10: 3}
+
+
+def test_decoder_counters():
+    decoder = FrameDecoder()
+    bad = bytearray(KEEP_ALIVE)
+    bad[-3] ^= 1
+    frames = list(decoder.feed(b'junk' + bytes(bad) +
+                               KEEP_ALIVE[:4] + KEEP_ALIVE))
+    assert len(frames) == 1
+    assert decoder.bad_crc == 1
+    assert decoder.resyncs == 1
+    assert decoder.discarded == 4 + 4
+
+
+def test_stats():
+    aq = AquaLogic()
+    aq._write = lambda data: None
+    aq.set_state(States.LIGHTS, True)
+    assert aq.stats()['send_queue_depth'] == 1
+    aq._process_data(b'\x00' * 3 + KEEP_ALIVE +
+                     encode_frame(b'\x04\x07') +
+                     leds_frame(States.LIGHTS), lambda panel: None)
+    stats = aq.stats()
+    assert stats['bytes_read'] > 0
+    assert stats['frames'] == {'keep_alive': 1, 'leds': 1, '0407': 1}
+    assert stats['unknown_frames'] == 1
+    assert stats['discarded_bytes'] == 3
+    assert stats['send_queue_depth'] == 0
+    assert stats['keep_alive_to_send']['count'] == 1
+    assert stats['retries']['buckets'][0] == 1
+    assert stats['confirmation_latency']['count'] == 1
+
+
+def test_keep_alive_to_send_from_read():
+    aq = AquaLogic()
+    aq._write = lambda data: None
+    aq.set_state(States.LIGHTS, True)
+    # The delay counts from when the chunk holding the keep-alive was read
+    aq._process_data(KEEP_ALIVE, lambda panel: None, time.monotonic() - 0.05)
+    assert aq.stats()['keep_alive_to_send']['sum'] >= 0.05
+
+
+def test_prometheus():
+    aq = AquaLogic()
+    aq._process_data(KEEP_ALIVE * 2, lambda panel: None)
+    text = prometheus_text({'pool': aq})
+    assert '# TYPE aqualogic_frames_total counter\n' in text
+    assert 'aqualogic_frames_total{panel="pool",type="keep_alive"} 2\n' in text
+    assert 'aqualogic_send_queue_depth{panel="pool"} 0\n' in text
+    assert ('aqualogic_retries_bucket{le="+Inf",panel="pool"} 0\n'
+            in text)
+
+    server = MetricsServer({'pool': aq}, port=0).start()
+    try:
+        url = 'http://127.0.0.1:{}/metrics'.format(server.port)
+        with urlopen(url) as response:
+            assert response.read().decode('utf-8') == text
+        with pytest.raises(HTTPError):
+            urlopen('http://127.0.0.1:{}/'.format(server.port))
+    finally:
+        server.close()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.batch import COLUMNS, decode_capture
+from aqualogic.codec import FRAME_DLE, FRAME_START
+from aqualogic.parallel import (split_points, decode_capture_parallel,
+                                decode_captures)
+import glob
+import random
+
+
+def noisy_capture(seed=0):
+    """Returns the test captures shuffled together with junk, truncated
+    frames, corrupted checksums and stray DLEs."""
+    rand = random.Random(seed)
+    data = bytearray()
+    for path in sorted(glob.glob('tests/data/*.bin')):
+        with open(path, 'rb') as capture:
+            data += capture.read()
+    pieces = data.split(FRAME_START)
+    rand.shuffle(pieces)
+    result = bytearray()
+    for piece in pieces:
+        choice = rand.random()
+        if choice < 0.05:
+            piece = piece[:rand.randrange(len(piece) + 1)]
+        elif choice < 0.1 and piece:
+            piece = bytearray(piece)
+            piece[rand.randrange(len(piece))] ^= 0x40
+        elif choice < 0.15:
+            piece = bytes([FRAME_DLE]) + piece
+        result += FRAME_START + piece
+    return bytes(result)
+
+
+def assert_same(parallel, serial):
+    for name, _, _ in COLUMNS:
+        assert (getattr(parallel, name).tobytes() ==
+                getattr(serial, name).tobytes()), name
+    assert parallel.bad_crc == serial.bad_crc
+    assert parallel.resyncs == serial.resyncs
+    assert parallel.discarded == serial.discarded
+    assert parallel.truncated == serial.truncated
+
+
+def test_split_points():
+    data = noisy_capture()
+    points = split_points(data, 100)
+    assert points == sorted(set(points))
+    for point in points:
+        assert data[point:point + 2] == FRAME_START
+        assert data[point - 1] != FRAME_DLE
+
+
+def test_matches_serial(tmp_path):
+    path = str(tmp_path / 'noisy.bin')
+    with open(path, 'wb') as capture:
+        capture.write(noisy_capture())
+    serial = decode_capture(path)
+    assert serial.resyncs > 0 and serial.bad_crc > 0
+    for chunk_size in (50, 333, 4096):
+        assert_same(decode_capture_parallel(path, workers=2,
+                                            chunk_size=chunk_size), serial)
+
+
+def test_many_files(tmp_path):
+    paths = []
+    for seed in range(3):
+        path = str(tmp_path / '{}.bin'.format(seed))
+        with open(path, 'wb') as capture:
+            capture.write(noisy_capture(seed))
+        paths.append(path)
+    paths += sorted(glob.glob('tests/data/*.bin'))
+    results = decode_captures(paths, workers=2, chunk_size=2000)
+    for path, result in zip(paths, results):
+        assert_same(result, decode_capture(path))
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.core import AquaLogic
+from aqualogic.profiling import ProfilingHooks, StageSampler
+from io import FileIO
+import itertools
+
+
+class RecordingHooks(ProfilingHooks):
+    def __init__(self):
+        self.calls = []
+
+    def frame_start(self):
+        self.calls.append('start')
+
+    def frame_decoded(self, frame_type):
+        self.calls.append(('decoded', frame_type))
+
+    def frame_dispatched(self, frame_type):
+        self.calls.append(('dispatched', frame_type))
+
+    def callbacks_done(self, frame_type):
+        self.calls.append(('done', frame_type))
+
+
+def process(path, hooks=None, callback=None):
+    aq = AquaLogic()
+    aq.set_profiling_hooks(hooks)
+    aq.connect_io(FileIO(path))
+    aq.process(callback)
+    return aq
+
+
+def test_hook_order():
+    hooks = RecordingHooks()
+    aq = AquaLogic()
+    aq.set_profiling_hooks(hooks)
+    data = open('tests/data/idle.bin', 'rb').read()
+    count = aq._process_data(data, lambda panel: None)
+    assert count > 0
+    assert hooks.calls[-1] == 'start'
+    for index in range(count):
+        start, decoded, dispatched, done = hooks.calls[index * 4:
+                                                       index * 4 + 4]
+        assert start == 'start'
+        assert decoded[0] == 'decoded'
+        assert decoded[1] == dispatched[1] == done[1]
+
+
+def test_hooks_match_unhooked():
+    for path in ('tests/data/pool_on.bin', 'tests/data/lights_on_off.bin'):
+        changes, hooked_changes = [], []
+        plain = process(path, None, lambda panel: changes.append(
+            panel.snapshot))
+        hooked = process(path, RecordingHooks(), lambda panel: (
+            hooked_changes.append(panel.snapshot)))
+        strip = lambda snapshot: snapshot._replace(timestamp=None,
+                                                   monotonic=None)
+        assert ([strip(s) for s in changes] ==
+                [strip(s) for s in hooked_changes])
+        assert plain.stats()['frames'] == hooked.stats()['frames']
+
+
+def test_sampler():
+    clock = itertools.count()
+    sampler = StageSampler(clock=lambda: next(clock))
+    aq = process('tests/data/pool_on.bin', sampler)
+    stats = sampler.stats()
+    frames = aq.stats()['frames']
+    for stage in ('decode', 'dispatch', 'callbacks'):
+        assert {name: values['count'] for name, values
+                in stats[stage].items()} == frames
+    # Each stage takes one tick of the fake clock
+    assert stats['dispatch']['keep_alive']['mean'] == 1
+    assert 'display_update' in sampler.report()
+
+    # Feed small reads, most of which end without a frame
+    sampler = StageSampler(sample_every=10)
+    aq = AquaLogic()
+    aq.set_profiling_hooks(sampler)
+    with open('tests/data/pool_on.bin', 'rb') as capture:
+        data = capture.read()
+    for start in range(0, len(data), 7):
+        aq._process_data(data[start:start + 7], lambda panel: None)
+    sampled = sum(values['count'] for values
+                  in sampler.stats()['decode'].values())
+    # The first of every ten frames is timed
+    assert sampled == (sum(frames.values()) - 1) // 10 + 1
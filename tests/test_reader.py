@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.reader import SocketReader, SerialReader, IOReader
+from io import BytesIO
+import pytest
+import serial
+import socket
+
+
+class FakeSerial(object):
+    """Serial port returning queued chunks; an empty read is a timeout."""
+
+    def __init__(self, *chunks):
+        self._data = b''.join(chunks)
+        self.reads = []
+
+    @property
+    def in_waiting(self):
+        return len(self._data)
+
+    def read(self, size=1):
+        self.reads.append(size)
+        data, self._data = self._data[:size], self._data[size:]
+        return data
+
+
+def test_socket_reader():
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        ours.settimeout(0.05)
+        reader = SocketReader(ours)
+        theirs.sendall(b'abc')
+        assert reader.read() == b'abc'
+        with pytest.raises(socket.timeout):
+            reader.read()
+        theirs.sendall(b'def')
+        theirs.close()
+        assert reader.read() == b'def'
+        # The peer closing the connection is the end of the data
+        with pytest.raises(EOFError):
+            reader.read()
+
+
+def test_serial_reader():
+    port = FakeSerial(b'x' * 10)
+    reader = SerialReader(port, size=4)
+    # Everything waiting is read, up to the size of the buffer
+    assert reader.read() == b'xxxx'
+    assert reader.read() == b'xxxx'
+    assert reader.read() == b'xx'
+    assert port.reads == [4, 4, 2]
+    # Nothing waiting: block for a byte, and time out if none comes
+    with pytest.raises(serial.SerialTimeoutException):
+        reader.read()
+    assert port.reads[-1] == 1
+
+
+def test_io_reader():
+    reader = IOReader(BytesIO(b'abcdef'), size=4)
+    assert reader.read() == b'abcd'
+    assert reader.read() == b'ef'
+    with pytest.raises(EOFError):
+        reader.read()
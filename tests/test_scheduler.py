@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.core import AquaLogic, States
+from aqualogic.keys import Keys
+from aqualogic.codec import encode_frame
+from aqualogic.scheduler import (SendScheduler, ConfirmationTracker,
+                                 PRIORITY_HIGH, PRIORITY_LOW)
+from concurrent.futures import Future
+import time
+
+
+def toggle(frame, state, enabled):
+    return {'frame': frame, 'retries': 10,
+            'desired_states': [{'state': state, 'enabled': enabled}]}
+
+
+class TestSendScheduler(object):
+    def test_priority_order(self):
+        scheduler = SendScheduler()
+        scheduler.put({'frame': b'a'}, PRIORITY_LOW)
+        scheduler.put({'frame': b'b'})
+        scheduler.put({'frame': b'c'})
+        scheduler.put({'frame': b'd'}, PRIORITY_HIGH)
+        assert [data['frame'] for data in scheduler.pending()] == \
+            [b'd', b'b', b'c', b'a']
+        assert [scheduler.get()['frame'] for _ in range(4)] == \
+            [b'd', b'b', b'c', b'a']
+        assert scheduler.get() is None
+        stats = scheduler.stats()
+        assert stats['sent'] == 4
+        assert stats['depth'] == 0
+
+    def test_coalesce(self):
+        dropped = []
+        scheduler = SendScheduler(dropped.append)
+        first = scheduler.put(toggle(b'x', States.AUX_1, True))
+        assert scheduler.put(toggle(b'x', States.AUX_1, True)) is first
+        assert scheduler.put(toggle(b'y', States.AUX_2, True)) is not None
+        assert scheduler.put(toggle(b'x', States.AUX_1, False)) is None
+        assert dropped == [first]
+        assert [data['frame'] for data in scheduler.pending()] == [b'y']
+        stats = scheduler.stats()
+        assert (stats['merged'], stats['cancelled']) == (1, 2)
+
+    def test_keys_not_coalesced(self):
+        scheduler = SendScheduler()
+        scheduler.put({'frame': b'm'})
+        scheduler.put({'frame': b'm'})
+        assert scheduler.qsize() == 2
+
+    def test_deadline(self):
+        dropped = []
+        scheduler = SendScheduler(dropped.append)
+        expired = scheduler.put({'frame': b'a'}, deadline=time.monotonic())
+        scheduler.put({'frame': b'b'})
+        time.sleep(0.01)
+        assert scheduler.get()['frame'] == b'b'
+        assert dropped == [expired]
+        assert scheduler.stats()['expired'] == 1
+
+    def test_set_state_cancels(self):
+        aq = AquaLogic()
+        assert aq.set_state(States.AUX_1, True)
+        assert aq.get_state(States.AUX_1)
+        assert aq.set_state(States.AUX_1, False)
+        assert not aq.get_state(States.AUX_1)
+        assert aq.send_queue_stats()['depth'] == 0
+
+    def test_pending_state_index(self):
+        aq = AquaLogic()
+        # Keys without desired states don't break the lookup
+        aq.send_key(Keys.MENU)
+        assert not aq.get_state(States.LIGHTS)
+        assert aq.set_state(States.LIGHTS, True)
+        assert aq._send_queue.pending_state(States.LIGHTS) is True
+        assert aq.get_state(States.LIGHTS)
+        assert aq._send_queue.get()['frame'] == aq._get_key_event_frame(
+            Keys.MENU)
+        assert aq.get_state(States.LIGHTS)
+        data = aq._send_queue.get()
+        # Still expected until confirmed or failed
+        assert aq._send_queue.pending_state(States.LIGHTS) is True
+        aq._send_queue.finished(data)
+        assert aq._send_queue.pending_state(States.LIGHTS) is None
+        assert not aq.get_state(States.LIGHTS)
+
+
+def leds_frame(states, flashing=0):
+    return encode_frame(AquaLogic.FRAME_TYPE_LEDS +
+                        states.to_bytes(4, byteorder='little') +
+                        flashing.to_bytes(4, byteorder='little'))
+
+
+KEEP_ALIVE = encode_frame(AquaLogic.FRAME_TYPE_KEEP_ALIVE)
+
+
+class TestConfirmation(object):
+    def panel(self):
+        aq = AquaLogic()
+        sent = []
+        aq._write = sent.append
+        return aq, sent
+
+    def test_confirmed_by_leds(self):
+        aq, sent = self.panel()
+        future = aq.request_state(States.LIGHTS, True)
+        aq._process_data(KEEP_ALIVE, lambda panel: None)
+        assert sent == [aq._get_key_event_frame(Keys.LIGHTS)]
+        assert not future.done()
+        aq._process_data(leds_frame(States.LIGHTS), lambda panel: None)
+        assert future.result(0) is True
+        stats = aq.confirmation_stats()
+        assert stats['confirmed'] == 1
+        assert stats['in_flight'] == 0
+        assert stats['latency_last'] >= 0
+
+    def test_pending_until_confirmed(self):
+        aq, sent = self.panel()
+        future = aq.request_state(States.LIGHTS, True)
+        aq._process_data(KEEP_ALIVE, lambda panel: None)
+        # Sent but not yet confirmed; asking again mustn't press it twice
+        assert aq.get_state(States.LIGHTS)
+        assert aq.set_state(States.LIGHTS, True)
+        aq._process_data(KEEP_ALIVE + leds_frame(0), lambda panel: None)
+        assert len(sent) == 1
+        assert aq.get_state(States.LIGHTS)
+        aq._process_data(leds_frame(States.LIGHTS), lambda panel: None)
+        assert future.result(0) is True
+        assert aq._send_queue.pending_state(States.LIGHTS) is None
+        aq._process_data(leds_frame(0), lambda panel: None)
+        assert not aq.get_state(States.LIGHTS)
+
+    def test_late_leds_after_expiry(self):
+        aq, sent = self.panel()
+        aq._confirmations._confirm_timeout = 0.05
+        future = aq.request_state(States.LIGHTS, True)
+        aq._process_data(KEEP_ALIVE, lambda panel: None)
+        time.sleep(0.06)
+        # Not confirmed in time, so a retry is queued
+        aq._process_data(leds_frame(0), lambda panel: None)
+        assert aq._send_queue.qsize() == 1
+        # The panel was just slow; pressing again would undo it
+        aq._process_data(leds_frame(States.LIGHTS) + KEEP_ALIVE,
+                         lambda panel: None)
+        assert len(sent) == 1
+        assert future.result(0) is True
+        assert aq._send_queue.qsize() == 0
+        assert aq._send_queue.pending_state(States.LIGHTS) is None
+
+    def test_confirmed_by_later_leds(self):
+        tracker = ConfirmationTracker()
+        tracker.add(toggle(b'x', States.LIGHTS, True), 0, led_frames=1)
+        # LEDs received before the press never confirm it
+        assert tracker.confirm(lambda state: True, 0, led_frames=1) == []
+        assert len(tracker.confirm(lambda state: True, 0,
+                                   led_frames=2)) == 1
+
+    def test_retry_then_fail(self):
+        aq, sent = self.panel()
+        aq._confirmations._confirm_timeout = 0
+        future = aq.request_state(States.LIGHTS, True)
+        for _ in range(12):
+            aq._process_data(KEEP_ALIVE, lambda panel: None)
+        assert len(sent) == 10
+        assert future.result(0) is False
+        assert aq.confirmation_stats()['timed_out'] == 10
+        assert not aq.get_state(States.LIGHTS)
+
+    def test_no_retry(self):
+        aq, sent = self.panel()
+        aq._tx_retry_enabled = False
+        aq._confirmations._confirm_timeout = 0
+        future = aq.request_state(States.LIGHTS, True)
+        aq._process_data(KEEP_ALIVE * 3, lambda panel: None)
+        assert len(sent) == 1
+        assert future.result(0) is False
+
+    def test_already_set(self):
+        aq, sent = self.panel()
+        assert aq.request_state(States.LIGHTS, False).result(0) is True
+        assert aq.request_state(States.HEATER_1, True).result(0) is False
+
+    def retried_against(self, enabled):
+        """Sends a LIGHTS on request, queues another LIGHTS press for
+        enabled behind it and lets the first expire unconfirmed."""
+        aq, sent = self.panel()
+        aq._confirmations._confirm_timeout = 0.05
+        first = aq.request_state(States.LIGHTS, True)
+        aq._process_data(KEEP_ALIVE, lambda panel: None)
+        second = toggle(aq._get_key_event_frame(Keys.LIGHTS), States.LIGHTS,
+                        enabled)
+        second['confirmed'] = Future()
+        aq._queue_frame(second)
+        time.sleep(0.06)
+        aq._process_data(leds_frame(0), lambda panel: None)
+        return aq, first, second
+
+    def test_retry_merged(self):
+        aq, first, second = self.retried_against(True)
+        assert not first.done()
+        aq._process_data(KEEP_ALIVE, lambda panel: None)
+        aq._process_data(leds_frame(States.LIGHTS), lambda panel: None)
+        assert second['confirmed'].result(0) is True
+        assert first.result(0) is True
+
+    def test_retry_cancelled(self):
+        aq, first, second = self.retried_against(False)
+        assert first.result(0) is False
+        assert second['confirmed'].result(0) is False
+        assert aq.send_queue_stats()['depth'] == 0
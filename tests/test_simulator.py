@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.aio import AsyncAquaLogic
+from aqualogic.core import AquaLogic, States
+from aqualogic.decoder import FrameDecoder
+from aqualogic.simulator import (SimulatedPanel, run_panels, display_frame,
+                                 pump_status_frame)
+import asyncio
+
+
+async def wait_for(condition, timeout=5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_frames():
+    aq = AquaLogic()
+    aq._process_data(display_frame('Pool Temp 80°F') +
+                     display_frame('Salt Level', '3100 PPM') +
+                     pump_status_frame(75, 1250), lambda panel: None)
+    assert aq.pool_temp == 80
+    assert not aq.is_metric
+    assert aq.salt_level == 3100
+    assert aq.pump_speed is None
+    assert aq.pump_power == 1250
+    assert len(list(FrameDecoder().feed(display_frame('x' * 40)))) == 1
+
+
+def test_tcp():
+    async def main():
+        panel = SimulatedPanel(key_delay=0.01, interval=0.005)
+        port = await panel.start_tcp()
+        aq = AsyncAquaLogic()
+        await aq.connect('127.0.0.1', port)
+        processing = asyncio.ensure_future(aq.process())
+        await wait_for(lambda: aq.pool_temp is not None and
+                       aq.get_state(States.POOL))
+        assert aq.pool_temp == 80
+        assert aq.air_temp == 70
+        assert await aq.request_state(States.LIGHTS, True)
+        assert panel.states & States.LIGHTS
+        assert await aq.request_state(States.POOL, False)
+        assert aq.get_state(States.SPA)
+        await panel.close()
+        await processing
+        await aq.close()
+    asyncio.run(main())
+
+
+def test_pty():
+    async def main():
+        panel = SimulatedPanel(key_delay=0.01, interval=0.005)
+        port_name = panel.start_pty()
+        aq = AsyncAquaLogic()
+        await aq.connect_serial(port_name)
+        processing = asyncio.ensure_future(aq.process())
+        await wait_for(lambda: aq.get_state(States.FILTER))
+        assert await aq.request_state(States.AUX_1, True)
+        processing.cancel()
+        await aq.close()
+        await panel.close()
+    asyncio.run(main())
+
+
+def test_many_panels():
+    async def main():
+        panels = await run_panels(50, interval=0.01)
+        clients = []
+        for _, port in panels:
+            aq = AsyncAquaLogic()
+            await aq.connect('127.0.0.1', port)
+            clients.append((aq, asyncio.ensure_future(aq.process())))
+        await wait_for(lambda: all(aq.pump_power == 1250
+                                   for aq, _ in clients))
+        for panel, _ in panels:
+            await panel.close()
+        for aq, processing in clients:
+            await processing
+            await aq.close()
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from aqualogic.core import AquaLogic, States
+from aqualogic.statecache import CACHED_FIELDS, load_state, save_state
+from io import FileIO
+import json
+import os
+import time
+
+
+def test_warm_start(tmp_path):
+    path = str(tmp_path / 'state.json')
+    aq = AquaLogic()
+    assert not aq.set_state_cache(path)
+    aq.connect_io(FileIO('tests/data/pool_on.bin'))
+    aq.process()
+    saved = aq.snapshot
+    assert os.listdir(str(tmp_path)) == ['state.json']
+
+    aq = AquaLogic()
+    assert aq.set_state_cache(path)
+    for name in CACHED_FIELDS:
+        assert getattr(aq.snapshot, name) == getattr(saved, name)
+    assert aq.snapshot.timestamp == saved.timestamp
+    assert {'states', 'salt_level'} <= aq.snapshot.stale_fields
+    # Keys toggle, so nothing is pressed until the LEDs are seen
+    assert not aq.set_state(States.LIGHTS, True)
+
+    aq.connect_io(FileIO('tests/data/lights_on_off.bin'))
+    aq.process()
+    stale = aq.snapshot.stale_fields
+    assert 'states' not in stale and 'flashing_states' not in stale
+    # Not shown in this capture, so still as cached
+    assert 'salt_level' in stale
+    assert aq.salt_level == saved.salt_level
+
+    # Stale values keep the time they were last reported
+    aq.save_state_cache()
+    fields = load_state(path)[1]
+    assert fields['salt_level'] == (saved.salt_level, saved.timestamp)
+    assert fields['states'][1] == aq.snapshot.timestamp > saved.timestamp
+
+
+def test_bad_cache(tmp_path):
+    path = str(tmp_path / 'state.json')
+    for text in ('{"version"', '[]', '{"version":2}',
+                 '{"version":2,"timestamp":1,"fields":{"states":3}}'):
+        with open(path, 'w') as file:
+            file.write(text)
+        assert load_state(path) is None
+    assert not AquaLogic().set_state_cache(path)
+
+
+def test_max_age(tmp_path):
+    path = str(tmp_path / 'state.json')
+    aq = AquaLogic()
+    aq.connect_io(FileIO('tests/data/pool_on.bin'))
+    aq.process()
+    save_state(path, aq.snapshot, {'salt_level': time.time() - 7200})
+    assert load_state(path)[1]['states'] == (aq.snapshot.states,
+                                             aq.snapshot.timestamp)
+    fields = load_state(path, max_age=3600)[1]
+    assert 'states' in fields and 'salt_level' not in fields
+    with open(path) as file:
+        document = json.load(file)
+    for field in document['fields'].values():
+        field[1] -= 7200
+    with open(path, 'w') as file:
+        json.dump(document, file)
+    assert load_state(path, max_age=3600) is None